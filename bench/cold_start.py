@@ -0,0 +1,136 @@
+"""
+Холодный старт: время от запуска процесса до первого обработанного апдейта.
+
+В свежем процессе импортируется бот, выполняется startup() из
+bot/lifecycle.py и через Dispatcher.feed_update обрабатывается апдейт
+«/start». Запросы к Telegram перехватывает фиктивная сессия aiogram, так что
+сеть не нужна. Сравниваются STARTUP_LAZY=0 (прогрев до приема апдейтов)
+и STARTUP_LAZY=1 (прогрев в фоне).
+
+Запуск:
+    python -m bench.cold_start [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import time
+t0 = time.perf_counter()
+import asyncio, json, sys
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.enums import ParseMode
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update
+
+from bot.handlers import router
+from bot.lifecycle import shutdown, startup
+
+t_import = time.perf_counter()
+
+
+class FakeSession(BaseSession):
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=1,
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError
+        yield b""
+
+    async def close(self):
+        pass
+
+
+async def main():
+    bot = Bot("123456:TEST", session=FakeSession(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp = Dispatcher()
+    dp.include_router(router)
+    await startup()
+    t_startup = time.perf_counter()
+    update = Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+            "text": "/start",
+        },
+    })
+    await dp.feed_update(bot, update)
+    t_first = time.perf_counter()
+    await shutdown()
+    print(json.dumps({
+        "import": t_import - t0,
+        "startup": t_startup - t_import,
+        "first_update": t_first - t0,
+    }))
+
+
+asyncio.run(main())
+"""
+
+
+def run_once(lazy: bool, db_path: str) -> dict[str, float]:
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        STARTUP_LAZY="1" if lazy else "0",
+        USAGE_DB_PATH=db_path,
+        # Ключ нужен, чтобы прогрев действительно создавал клиент OpenRouter
+        OPENROUTER_API_KEY=os.environ.get("OPENROUTER_API_KEY") or "bench",
+    )
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "child failed")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall"] = wall
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Время до первого обработанного апдейта")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "usage.sqlite3")
+        for lazy in (False, True):
+            runs = []
+            for _ in range(args.repeat):
+                try:
+                    runs.append(run_once(lazy, db_path))
+                except RuntimeError as e:
+                    print(f"Ошибка: {e}")
+                    return 1
+            label = "STARTUP_LAZY=1" if lazy else "STARTUP_LAZY=0"
+            parts = [
+                f"{key} {statistics.median(r[key] for r in runs) * 1000:.0f} мс"
+                for key in ("import", "startup", "first_update", "wall")
+            ]
+            print(f"{label}: " + ", ".join(parts))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""
+Время импорта модулей бота по данным `python -X importtime`.
+
+Каждый прогон идет в отдельном чистом процессе; берется минимум по
+прогонам (первый обычно дороже из-за компиляции .pyc). Печатается общее
+время и самые дорогие модули по накопленному и собственному времени,
+а также какие тяжелые зависимости были загружены при импорте.
+
+Запуск:
+    python -m bench.import_time [bot.handlers main] [--repeat 3] [--top 15]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Должны импортироваться только по требованию
+HEAVY_MODULES = ["openai", "httpx", "PIL", "pypdf", "docx"]
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str) -> dict[str, tuple[int, int, int]]:
+    """Модуль -> (собственное, накопленное время в мкс, глубина вложенности)."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["?"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+    result: dict[str, tuple[int, int, int]] = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            result[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return result
+
+
+def best_of(module: str, repeat: int) -> dict[str, tuple[int, int, int]]:
+    best: dict[str, tuple[int, int, int]] = {}
+    for _ in range(repeat):
+        for name, (self_us, cumulative_us, depth) in measure(module).items():
+            prev = best.get(name)
+            if prev is None or cumulative_us < prev[1]:
+                best[name] = (self_us, cumulative_us, depth)
+    return best
+
+
+def report(module: str, timings: dict[str, tuple[int, int, int]], top: int):
+    total = timings.get(module, (0, 0, 0))[1]
+    print(f"{module}: {total / 1000:.1f} мс, модулей {len(timings)}")
+
+    # По накопленному времени — только прямые импорты верхнего уровня
+    # (глубина 1 относительно целевого модуля), иначе список забит вложенными
+    direct = [(name, t) for name, t in timings.items() if name != module and t[2] <= 1]
+    direct.sort(key=lambda kv: kv[1][1], reverse=True)
+    print("  накопленное время:")
+    for name, (_, cumulative_us, _) in direct[:top]:
+        print(f"    {cumulative_us / 1000:8.1f} мс  {name}")
+
+    by_self = sorted(timings.items(), key=lambda kv: kv[1][0], reverse=True)
+    print("  собственное время:")
+    for name, (self_us, _, _) in by_self[:top]:
+        print(f"    {self_us / 1000:8.1f} мс  {name}")
+
+    loaded = [m for m in HEAVY_MODULES if m in timings]
+    print(f"  тяжелые зависимости при импорте: {', '.join(loaded) if loaded else 'нет'}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Время импорта модулей бота")
+    parser.add_argument("modules", nargs="*", default=["bot.handlers", "main"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        try:
+            timings = best_of(module, args.repeat)
+        except RuntimeError as e:
+            print(e)
+            return 1
+        report(module, timings, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,150 @@
+"""
+Стоимость логирования в event loop: прежняя схема (basicConfig, запись в
+stdout прямо из обработчика, f-строки с полным вопросом) против
+bot/logs.setup_logging (очередь, JSON в отдельном потоке, DEBUG с
+сэмплированием, скрытый текст пользователя).
+
+На один вопрос пишутся строки, которые реально идут из горячего пути
+(решение о поиске, улучшенный запрос, запуск поиска или попадание в кэш,
+usage, тайминги). Сток — быстрый или «медленный stdout» (запись
+держит поток N мкс, как забитый pipe логового драйвера контейнера).
+Для очереди отдельно показано, сколько после теста дописывал поток
+записи (это время не в event loop).
+Меряется время вызовов логгера в потоке event loop на вопрос.
+
+Запуск:
+    python -m bench.logging_overhead [--queries 5000] [--slow-us 200] [--gap-us 500]
+"""
+import argparse
+import io
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.logs import redact, setup_logging, shutdown_logging  # noqa: E402
+
+QUESTIONS = [
+    "Продаю долю в ООО, которой владел 4 года — нужно ли платить НДФЛ?",
+    "У меня ИП на УСН 6%, что с НДС с 2026 года при доходе 70 млн?",
+    "Какой штраф за просрочку декларации 3-НДФЛ на 10 дней, если налог уплачен вовремя?",
+    "Иностранная компания из Катара платит дивиденды российскому участнику — валютный контроль?",
+]
+
+logger = logging.getLogger("bench.hot_path")
+
+
+class SlowStream(io.TextIOBase):
+    """Сток, запись в который занимает delay секунд (забитый stdout)."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            # Заблокированная запись в pipe отпускает GIL — как и sleep
+            time.sleep(self.delay)
+        self.lines += 1
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def legacy_query(query: str, enhanced: str, cached: bool):
+    coverage, results, latency = 0.31, 5, 4.2
+    logger.info(f"Web search enabled: recency; coverage={coverage:.2f}<0.5")
+    logger.info(f"Tavily search: original='{query}', enhanced='{enhanced}'")
+    if cached:
+        logger.info(f"Tavily cache hit for: {query}")
+    else:
+        logger.info(f"Tavily search triggered for: {query}")
+        logger.info(f"Tavily search returned {results} results.")
+    logger.info(f"Usage user=1 kind=query topic=tax model=m tokens=3000+800 (cached 0) searches=1 latency={latency:.2f}s status=ok")
+    logger.info(f"Pipeline timings: total={latency * 1000:.0f}ms retrieval@0ms+3ms search@3ms+1800ms llm@1803ms+2300ms")
+
+
+def new_query(query: str, enhanced: str, cached: bool):
+    logger.debug("Web search %s: %s", "enabled", "recency; coverage=0.31<0.5")
+    logger.debug("Tavily search: original=%s, enhanced=%s", redact(query), redact(enhanced))
+    if cached:
+        logger.debug("Tavily cache hit for: %s", redact(query))
+    else:
+        logger.info("Tavily search triggered for: %s", redact(query))
+        logger.info("Tavily search returned 5 results.")
+    logger.info(
+        "Usage user=1 kind=query topic=tax model=m tokens=3000+800 (cached 0) searches=1 latency=4.20s status=ok",
+        extra={"prompt_tokens": 3000, "completion_tokens": 800, "latency_ms": 4200, "status": "ok"},
+    )
+    logger.info(
+        "Pipeline timings: total=4200ms retrieval@0ms+3ms search@3ms+1800ms llm@1803ms+2300ms",
+        extra={"stages": {"retrieval": [0, 3], "search": [3, 1800], "llm": [1803, 2300]}, "total_ms": 4200},
+    )
+
+
+def _legacy_setup(stream):
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    return handler
+
+
+def run(fn, queries: int, gap: float, seed: int) -> list[float]:
+    rng = random.Random(seed)
+    per_query = []
+    for _ in range(queries):
+        query = rng.choice(QUESTIONS)
+        start = time.perf_counter()
+        fn(query, query + " НДФЛ статья 217 НК РФ", rng.random() < 0.4)
+        per_query.append(time.perf_counter() - start)
+        # В боте между строками лога — ожидание сети; в это время пишет поток очереди
+        time.sleep(gap)
+    return per_query
+
+
+def report(name: str, sink: str, times: list[float], written: int, flush_s: float):
+    us = sorted(t * 1e6 for t in times)
+    p99 = us[int(len(us) * 0.99) - 1]
+    print(
+        f"{name:<8} {sink:<10} {statistics.median(us):8.1f} мкс/вопрос (p99 {p99:8.1f})  "
+        f"строк {written:6d}  дозапись после теста {flush_s * 1000:6.0f} мс"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Накладные расходы логирования на вопрос")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--slow-us", type=float, default=200.0, help="задержка записи медленного стока, мкс")
+    parser.add_argument("--gap-us", type=float, default=500.0, help="пауза между вопросами, мкс")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    for sink_name in ("fast", "slow"):
+        # Прежняя схема: запись в сток прямо в вызывающем потоке
+        stream = SlowStream(args.slow_us / 1e6 if sink_name == "slow" else 0.0)
+        handler = _legacy_setup(stream)
+        times = run(legacy_query, args.queries, args.gap_us / 1e6, args.seed)
+        logging.getLogger().removeHandler(handler)
+        report("legacy", sink_name, times, stream.lines, 0.0)
+
+        # Очередь и JSON в отдельном потоке
+        stream = SlowStream(args.slow_us / 1e6 if sink_name == "slow" else 0.0)
+        setup_logging(stream)
+        times = run(new_query, args.queries, args.gap_us / 1e6, args.seed)
+        start = time.perf_counter()
+        shutdown_logging()
+        report("queue", sink_name, times, stream.lines, time.perf_counter() - start)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+"""
+Сравнение локального OCR с отправкой изображения в модель.
+
+Для каждого файла измеряется время OCR (в том же пуле процессов, что и
+в боте) и уверенность распознавания. Если задан OPENROUTER_API_KEY, дополнительно
+делаются два одинаковых запроса к модели: с распознанным текстом и с
+изображением — разница задержек и есть добавка за vision-вызов.
+
+Запуск:
+    python -m bench.ocr_vs_vision scan1.jpg scan2.png [--repeat 3] [--no-llm]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.config import config  # noqa: E402
+from bot.images import prepare_image  # noqa: E402
+from bot.ocr import extract_text, is_confident  # noqa: E402
+from bot.workers import shutdown_workers  # noqa: E402
+
+PROMPT = "Кратко перескажи содержание документа (2–3 предложения)."
+
+
+async def _timed(coro) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
+
+
+async def bench_file(path: str, repeat: int, use_llm: bool):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    ocr_times = []
+    result = None
+    for _ in range(repeat):
+        elapsed, result = await _timed(extract_text(data))
+        ocr_times.append(elapsed)
+    print(f"{os.path.basename(path)}: {len(data) / 1024:.0f} КБ")
+    print(
+        f"  OCR: median {statistics.median(ocr_times) * 1000:.0f} мс, "
+        f"{len(result.text)} симв., уверенность {result.confidence:.0f}, "
+        f"{'текстом' if is_confident(result) else 'нужна картинка'}"
+        + (f", ошибка {result.error}" if result.error else "")
+    )
+
+    if not use_llm:
+        return
+    from bot.handlers import _to_data_url
+    from bot.llm import llm_client
+
+    if not llm_client.client:
+        print("  LLM: OPENROUTER_API_KEY не задан, пропускаю")
+        return
+    prepared = await prepare_image(data, True)
+    image_url = _to_data_url(*prepared) if prepared else _to_data_url(data, "image/jpeg")
+
+    text_times, vision_times = [], []
+    for _ in range(repeat):
+        elapsed, _ = await _timed(llm_client.generate_response(f"{PROMPT}\n\n{result.text}"))
+        text_times.append(elapsed)
+        elapsed, _ = await _timed(llm_client.generate_response(PROMPT, image_urls=[image_url]))
+        vision_times.append(elapsed)
+    text_ms = statistics.median(text_times) * 1000
+    vision_ms = statistics.median(vision_times) * 1000
+    print(
+        f"  LLM ({config.MODEL_NAME}): текст {text_ms:.0f} мс, изображение {vision_ms:.0f} мс, "
+        f"добавка vision {vision_ms - text_ms:+.0f} мс против OCR "
+        f"{statistics.median(ocr_times) * 1000:.0f} мс"
+    )
+
+
+async def main_async(args):
+    try:
+        for path in args.files:
+            await bench_file(path, args.repeat, not args.no_llm)
+    finally:
+        shutdown_workers()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="OCR против vision-вызова")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-llm", action="store_true", help="только замер OCR")
+    asyncio.run(main_async(parser.parse_args(argv)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
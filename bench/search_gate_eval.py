@@ -0,0 +1,105 @@
+"""
+Офлайн-оценка гейта веб-поиска на размеченном наборе вопросов.
+
+Метка needs_search=true значит, что без веб-поиска качественный ответ
+дать нельзя (нужна практика, свежие изменения или норма вне корпуса).
+Для каждого порога покрытия считаются доля запросов с поиском, полнота
+(вопросы, которым поиск нужен и был сделан — прокси качества ответа)
+и лишние поиски. Для сравнения приводится прежнее правило по ключевым словам.
+
+Запуск:
+    python -m bench.search_gate_eval [--queries bench/search_gate_queries.jsonl] [--thresholds 0.4,0.6,0.8]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.articles import article_index  # noqa: E402
+from bot.config import config  # noqa: E402
+from bot.router import detect_topic  # noqa: E402
+from bot.search_gate import decide_web_search  # noqa: E402
+
+# Прежний гейт: любой запрос длиннее 80 символов или с ключевым словом
+LEGACY_KEYWORDS = [
+    "санкц", "ндпи", "налог", "изменени", "закон", "указ", "постановлен", "судебн",
+    "практик", "нк рф", "минфин", "фнс", "доля", "участи", "уставн", "иностранн",
+    "нерезидент", "валютн", "cbr", "центробанк", "письмо", "разъяснен", "льгот",
+    "освобожден", "недвижим", "актив", "прибыл",
+]
+
+
+def legacy_gate(query: str) -> bool:
+    q = query.strip().lower()
+    if not q:
+        return False
+    if len(q) > 80:
+        return True
+    return any(word in q for word in LEGACY_KEYWORDS)
+
+
+def adaptive_gate(query: str) -> bool:
+    topic = detect_topic(query)
+    has_exact = bool(article_index.lookup(query, topic))
+    return decide_web_search(query, topic, has_exact_article=has_exact).search
+
+
+def evaluate(items: list[dict], gate) -> dict:
+    searched = needed = hit = wasted = missed = 0
+    misses: list[str] = []
+    for item in items:
+        decision = gate(item["query"])
+        label = bool(item["needs_search"])
+        searched += decision
+        needed += label
+        if decision and label:
+            hit += 1
+        elif decision and not label:
+            wasted += 1
+        elif label:
+            missed += 1
+            misses.append(item["query"])
+    total = len(items) or 1
+    return {
+        "search_rate": searched / total,
+        "recall": hit / needed if needed else 1.0,
+        "wasted": wasted,
+        "missed": missed,
+        "misses": misses,
+    }
+
+
+def _row(name: str, res: dict) -> str:
+    return (
+        f"{name:<18} search_rate={res['search_rate']:.0%}  recall={res['recall']:.0%}  "
+        f"wasted={res['wasted']}  missed={res['missed']}"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    default_queries = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_gate_queries.jsonl")
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", default=default_queries)
+    parser.add_argument("--thresholds", default="0.4,0.5,0.6,0.7,0.8")
+    parser.add_argument("--verbose", action="store_true", help="показать пропущенные вопросы")
+    args = parser.parse_args(argv)
+
+    with open(args.queries, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    print(f"{len(items)} вопросов, нужен поиск: {sum(bool(i['needs_search']) for i in items)}")
+    print(_row("legacy", evaluate(items, legacy_gate)))
+    for raw in args.thresholds.split(","):
+        config.SEARCH_COVERAGE_THRESHOLD = float(raw)
+        res = evaluate(items, adaptive_gate)
+        print(_row(f"adaptive@{raw}", res))
+        if args.verbose:
+            for q in res["misses"]:
+                print(f"    missed: {q}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+"""
+Нарезка длинных HTML-ответов на сообщения Telegram: прежний _split_message
+против bot/telegram_html.format_html.
+
+Генерируются ответы по ~20k символов в стиле модели (заголовки <b>,
+ссылки, списки, код, одиночные «<» и «&», иногда перепутанная
+вложенность). Для каждого способа считается время и сколько кусков
+Telegram отверг бы: неразрешенный тег, несбалансированные теги, сырой «&»
+или превышение лимита.
+
+Запуск:
+    python -m bench.telegram_html [--answers 200] [--chars 20000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.telegram_html import TELEGRAM_MAX_LEN, format_html  # noqa: E402
+
+ALLOWED_TAGS = {"b", "i", "u", "s", "a", "code", "pre", "blockquote", "tg-spoiler", "span", "tg-emoji"}
+_RAW_AMP_RE = re.compile(r"&(?!lt;|gt;|amp;|quot;|#\d+;|#x[0-9a-fA-F]+;)")
+
+WORDS = (
+    "налог ставка доход организации статья НК РФ вычет срок уплаты декларация "
+    "нерезидент валютный контроль дивиденды доля участника прибыль"
+).split()
+NOISE = ["<5%", "A&B", "ООО «Ромашка» & партнеры", "x < y", "&nbsp;", "—"]
+
+
+def legacy_split(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[str]:
+    """Прежний _split_message из bot/handlers.py."""
+    if len(text) <= limit:
+        return [text]
+    parts: list[str] = []
+    remaining = text
+    while len(remaining) > limit:
+        cut = remaining.rfind("\n", 0, limit + 1)
+        if cut == -1:
+            cut = remaining.rfind(" ", 0, limit + 1)
+        if cut == -1 or cut < limit * 0.3:
+            cut = limit
+        parts.append(remaining[:cut].strip())
+        remaining = remaining[cut:].lstrip()
+    if remaining:
+        parts.append(remaining)
+    return parts
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), f"<b>{rng.choice(WORDS)}</b>")
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f'<a href="https://example.ru/doc?id={rng.randint(1, 999)}&p=1">{rng.choice(WORDS)} {rng.choice(WORDS)}</a>')
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), rng.choice(NOISE))
+    return " ".join(words).capitalize() + "."
+
+
+def make_answer(rng: random.Random, chars: int) -> str:
+    parts: list[str] = []
+    size = 0
+    section = 1
+    while size < chars:
+        block = rng.random()
+        if block < 0.15:
+            piece = f"<b>{section}. {rng.choice(WORDS).capitalize()}</b>\n"
+            section += 1
+        elif block < 0.25:
+            piece = "".join(f"• {_sentence(rng)}\n" for _ in range(rng.randint(2, 5)))
+        elif block < 0.3:
+            piece = "<pre>" + "\n".join(f"строка {i}: a < b && c" for i in range(rng.randint(3, 10))) + "</pre>\n"
+        elif block < 0.35:
+            # Перепутанная вложенность и длинный абзац без переносов
+            piece = f"<b>Важно: <i>{' '.join(_sentence(rng) for _ in range(40))}</b></i>\n\n"
+        else:
+            piece = " ".join(_sentence(rng) for _ in range(rng.randint(2, 6))) + "\n\n"
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)
+
+
+class _Validator(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: list[str] = []
+        self.ok = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in ALLOWED_TAGS:
+            self.ok = False
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack[-1] != tag:
+            self.ok = False
+        else:
+            self.stack.pop()
+
+
+def is_valid(chunk: str) -> bool:
+    if len(chunk.encode("utf-16-le")) // 2 > TELEGRAM_MAX_LEN or _RAW_AMP_RE.search(chunk):
+        return False
+    validator = _Validator()
+    validator.feed(chunk)
+    validator.close()
+    return validator.ok and not validator.stack
+
+
+def bench(name: str, fn, answers: list[str], repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [fn(answer) for answer in answers]
+        times.append(time.perf_counter() - start)
+    chunks = [chunk for result in results for chunk in result]
+    invalid = sum(1 for chunk in chunks if not is_valid(chunk))
+    bad_answers = sum(1 for result in results if not all(is_valid(c) for c in result))
+    per_answer = statistics.median(times) / len(answers)
+    total_chars = sum(len(a) for a in answers)
+    print(
+        f"{name:<12} {per_answer * 1000:6.2f} мс/ответ  "
+        f"{total_chars / statistics.median(times) / 1e6:5.1f} Мсимв/с  "
+        f"кусков {len(chunks)}, отвергнутых {invalid} ({bad_answers} ответов с ошибкой)"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Нарезка HTML-ответов для Telegram")
+    parser.add_argument("--answers", type=int, default=200)
+    parser.add_argument("--chars", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    answers = [make_answer(rng, args.chars) for _ in range(args.answers)]
+    print(f"{len(answers)} ответов по ~{args.chars} символов")
+    bench("legacy", legacy_split, answers, args.repeat)
+    bench("format_html", format_html, answers, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
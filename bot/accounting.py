@@ -0,0 +1,349 @@
+"""
+Учет токенов, вызовов поиска и задержки по каждому запросу.
+
+Данные запроса копятся в RequestUsage (доступен через contextvar из
+llm.py и search.py), агрегируются в памяти и пачками сбрасываются в
+SQLite фоновым циклом. Дневные квоты пользователя проверяются до
+дорогих этапов (поиск, модель). Для отмененных запросов оценивается,
+сколько токенов и времени сэкономила отмена (по средним значениям
+завершенных запросов). Счетчики, квоты и строки в базе ведутся по каждому
+боту процесса отдельно.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+from bot.config import DEFAULT_BOT, bot_name, config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    llm_calls INTEGER NOT NULL,
+    search_calls INTEGER NOT NULL,
+    latency_ms INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    bot TEXT NOT NULL DEFAULT 'default'
+);
+CREATE INDEX IF NOT EXISTS requests_day_user ON requests (day, user_id);
+"""
+
+# Средняя длина токена в символах для русского текста ответа (оценка по потоку)
+CHARS_PER_TOKEN = 3.0
+
+_TOTALS_FIELDS = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "search_calls")
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class RequestUsage:
+    def __init__(self, user_id: int, kind: str = "query", topic: str = ""):
+        self.user_id = user_id
+        self.bot = bot_name()
+        self.kind = kind
+        self.topic = topic
+        self.model = ""
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.llm_calls = 0
+        self.search_calls = 0
+        # Оценка токенов ответа, пришедших из потока до отмены (usage в этом случае не приходит)
+        self.streamed_tokens = 0
+        self.status = "ok"
+        self.started = time.perf_counter()
+        self.ts = time.time()
+        self.latency = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def row(self) -> tuple:
+        return (
+            self.ts, datetime.fromtimestamp(self.ts, timezone.utc).strftime("%Y-%m-%d"),
+            self.user_id, self.kind, self.topic, self.model,
+            self.prompt_tokens, self.completion_tokens, self.cached_tokens,
+            self.llm_calls, self.search_calls, int(self.latency * 1000), self.status, self.bot,
+        )
+
+
+current_usage: ContextVar[RequestUsage | None] = ContextVar("current_usage", default=None)
+
+
+def record_llm_usage(model: str, usage: Any):
+    """Вызывается после ответа модели; usage — объект usage из ответа OpenAI-совместимого API."""
+    req = current_usage.get()
+    if req is None:
+        return
+    req.llm_calls += 1
+    req.model = model
+    if usage is None:
+        return
+    req.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+    req.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    req.cached_tokens += (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+
+def record_llm_cancelled(model: str, streamed_chars: int):
+    """
+    Поток ответа закрыт, потому что запрос отменил пользователь (новое сообщение, /clear);
+    таймауты сюда не попадают. streamed_chars — длина уже пришедшего текста ответа.
+    """
+    req = current_usage.get()
+    if req is None:
+        return
+    req.llm_calls += 1
+    req.model = model
+    # Куски потока бывают разной длины, поэтому токены оцениваются по символам:
+    # так их можно вычитать из средних completion_tokens завершенных запросов
+    req.streamed_tokens += round(streamed_chars / CHARS_PER_TOKEN)
+
+
+def record_llm_failure(status: str):
+    """Модель не дала ответа ("timeout" или "error"): вместо ответа будет текст ошибки."""
+    req = current_usage.get()
+    if req is not None:
+        req.status = status
+
+
+def record_search_call():
+    req = current_usage.get()
+    if req is not None:
+        req.search_calls += 1
+
+
+class Accountant:
+    def __init__(self, db_path: str, flush_interval: float, batch_size: int):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._buffer: list[tuple] = []
+        # (день, бот, пользователь) -> [запросы, токены, вызовы поиска]
+        self._daily: dict[tuple[str, str, int], list[int]] = defaultdict(lambda: [0, 0, 0])
+        # (день, бот, тема, модель) -> [запросы, prompt, completion, cached, вызовы поиска]
+        self.totals: dict[tuple[str, str, str, str], list[int]] = defaultdict(lambda: [0, 0, 0, 0, 0])
+        # (день, бот) -> [отмененные запросы, сэкономленные токены, сэкономленные секунды]
+        self.savings: dict[tuple[str, str], list] = defaultdict(lambda: [0, 0, 0.0])
+        # Скользящие средние завершенных вопросов: prompt, completion, задержка
+        self._avg: list[float] | None = None
+        self._flush_now = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @contextmanager
+    def track(self, user_id: int, kind: str = "query", topic: str = "") -> Iterator[RequestUsage]:
+        usage = RequestUsage(user_id, kind=kind, topic=topic)
+        token = current_usage.set(usage)
+        try:
+            yield usage
+        except asyncio.CancelledError:
+            usage.status = "cancelled"
+            raise
+        except Exception:
+            usage.status = "error"
+            raise
+        finally:
+            current_usage.reset(token)
+            self.finish(usage)
+
+    def finish(self, usage: RequestUsage):
+        usage.latency = time.perf_counter() - usage.started
+        day = _today()
+        daily = self._daily[(day, usage.bot, usage.user_id)]
+        if usage.kind == "query":
+            daily[0] += 1
+        daily[1] += usage.total_tokens
+        daily[2] += usage.search_calls
+        totals = self.totals[(day, usage.bot, usage.topic, usage.model)]
+        totals[0] += 1
+        totals[1] += usage.prompt_tokens
+        totals[2] += usage.completion_tokens
+        totals[3] += usage.cached_tokens
+        totals[4] += usage.search_calls
+        if usage.kind == "query":
+            if usage.status == "ok" and usage.llm_calls:
+                self._update_averages(usage)
+            elif usage.status == "cancelled":
+                self._count_savings(day, usage)
+        self._buffer.append(usage.row())
+        logger.info(
+            f"Usage bot={usage.bot} user={usage.user_id} kind={usage.kind} topic={usage.topic or '-'} model={usage.model or '-'} "
+            f"tokens={usage.prompt_tokens}+{usage.completion_tokens} (cached {usage.cached_tokens}) "
+            f"searches={usage.search_calls} latency={usage.latency:.2f}s status={usage.status}",
+            extra={
+                "kind": usage.kind, "topic": usage.topic, "model": usage.model,
+                "prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                "search_calls": usage.search_calls, "latency_ms": round(usage.latency * 1000),
+                "status": usage.status,
+            },
+        )
+        if len(self._buffer) >= self.batch_size:
+            self._flush_now.set()
+
+    def _update_averages(self, usage: RequestUsage, alpha: float = 0.1):
+        sample = [usage.prompt_tokens, usage.completion_tokens, usage.latency]
+        if self._avg is None:
+            self._avg = [float(v) for v in sample]
+        else:
+            self._avg = [avg + alpha * (value - avg) for avg, value in zip(self._avg, sample)]
+
+    def _count_savings(self, day: str, usage: RequestUsage):
+        saved = self.savings[(day, usage.bot)]
+        saved[0] += 1
+        if self._avg is None:
+            return
+        avg_prompt, avg_completion, avg_latency = self._avg
+        if usage.llm_calls:
+            # Промпт уже оплачен, не пришедшая часть ответа — нет
+            tokens = max(0, int(avg_completion) - usage.streamed_tokens)
+        else:
+            tokens = int(avg_prompt + avg_completion)
+        seconds = max(0.0, avg_latency - usage.latency)
+        saved[1] += tokens
+        saved[2] += seconds
+        logger.info(f"Cancelled query of user {usage.user_id} saved ~{tokens} tokens, ~{seconds:.1f}s")
+
+    def check_quota(self, user_id: int) -> str | None:
+        """Причина отказа, если дневная квота исчерпана, иначе None."""
+        requests, tokens, _ = self._daily.get((_today(), bot_name(), user_id), (0, 0, 0))
+        if config.USER_DAILY_REQUESTS and requests >= config.USER_DAILY_REQUESTS:
+            return "requests"
+        if config.USER_DAILY_TOKENS and tokens >= config.USER_DAILY_TOKENS:
+            return "tokens"
+        return None
+
+    async def report(self, day: str | None = None) -> dict[str, dict[str, int]]:
+        """Сводка за день по ботам: запросы, токены, вызовы поиска, отмененные запросы."""
+        day = day or _today()
+        if day != _today():
+            # В памяти только сегодняшние счетчики; прошлые дни — из базы
+            return await asyncio.to_thread(self._report_db, day)
+        report: dict[str, dict[str, int]] = {}
+        for (d, bot, _, _), values in self.totals.items():
+            if d != day:
+                continue
+            row = report.setdefault(bot, dict.fromkeys((*_TOTALS_FIELDS, "cancelled"), 0))
+            for name, value in zip(_TOTALS_FIELDS, values):
+                row[name] += value
+        for (d, bot), saved in self.savings.items():
+            if d == day and bot in report:
+                report[bot]["cancelled"] = saved[0]
+        return report
+
+    def _report_db(self, day: str) -> dict[str, dict[str, int]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT bot, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cached_tokens), "
+                "SUM(search_calls), SUM(kind = 'query' AND status = 'cancelled') "
+                "FROM requests WHERE day = ? GROUP BY bot",
+                (day,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            bot: dict(zip((*_TOTALS_FIELDS, "cancelled"), (int(v or 0) for v in values)))
+            for bot, *values in rows
+        }
+
+    def _prune(self):
+        """Убирает счетчики прошлых дней: квотам нужен только сегодняшний, отчет читает базу."""
+        today = _today()
+        for counters in (self._daily, self.totals, self.savings):
+            for key in [k for k in counters if k[0] < today]:
+                del counters[key]
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(_SCHEMA)
+        # Базы, созданные до учета по ботам: все старые строки относятся к единственному боту
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(requests)")}
+        if "bot" not in columns:
+            conn.execute(f"ALTER TABLE requests ADD COLUMN bot TEXT NOT NULL DEFAULT '{DEFAULT_BOT}'")
+        return conn
+
+    def _write(self, rows: list[tuple]):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+    def _load_today(self) -> list[tuple]:
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT bot, user_id, SUM(kind = 'query'), SUM(prompt_tokens + completion_tokens), SUM(search_calls) "
+                "FROM requests WHERE day = ? GROUP BY bot, user_id",
+                (_today(),),
+            ).fetchall()
+        finally:
+            conn.close()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception as e:
+            logger.error(f"Usage flush error: {e}")
+            # Вернем строки в буфер, чтобы записать при следующем сбросе
+            self._buffer = rows + self._buffer
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+            # Прошлые дни удаляем, только когда их строки уже в базе
+            if not self._buffer:
+                self._prune()
+
+    async def start(self):
+        """Поднимает дневные счетчики из базы (квоты переживают рестарт) и запускает сброс."""
+        try:
+            for bot, user_id, requests, tokens, searches in await asyncio.to_thread(self._load_today):
+                self._daily[(_today(), bot, user_id)] = [requests or 0, tokens or 0, searches or 0]
+        except Exception as e:
+            logger.error(f"Usage load error: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+accountant = Accountant(config.USAGE_DB_PATH, config.USAGE_FLUSH_SECONDS, config.USAGE_BATCH_SIZE)
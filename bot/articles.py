@@ -0,0 +1,243 @@
+"""
+Быстрый поиск статей по номеру без просмотра всего файла закона.
+
+Из вопроса извлекаются ссылки вида «ст. 280», «статья 217 п. 17.2»,
+«ч. 1 ст. 15.25 КоАП», «ст. 280 и 284 НК РФ», а статьи берутся из словаря,
+заранее построенного по корпусу в data/ (см. bot/ingest.py).
+"""
+import logging
+import os
+import re
+import threading
+from typing import NamedTuple
+
+from bot.config import config
+from bot.ingest import ARTICLE_RE, CHAPTER_RE, SECTION_RE
+
+logger = logging.getLogger(__name__)
+
+MAX_REFS = 5
+
+CODE_LABELS = {
+    "tax": "НК РФ",
+    "koap": "КоАП РФ",
+    "ved": "законодательство о ВЭД",
+}
+
+_NUM = r"\d+(?:\.\d+)*(?:-\d+)?"
+_ARTICLE_REF_RE = re.compile(rf"(?<![а-яё])(?:ст\.?|стать[а-яё]*)\s*({_NUM})", re.IGNORECASE)
+# Перечисление после одной «ст.»/«статьи»: «ст. 280 и 284», «статьи 346.12, 346.13».
+# Числа со сроками и суммами («ст. 15.25 и 3 года») номерами статей не считаются
+_ENUM_RE = re.compile(
+    rf"\s*(?:,|и|или)\s*({_NUM})(?!\d|\.\d|\s*(?:%|лет|год|дн|мес|руб|тыс|млн))",
+    re.IGNORECASE,
+)
+_PART_RE = re.compile(
+    rf"(?<![а-яё])(?:ч\.|час(?:ть|ти|тью)|п\.|пп\.|подп\.|пункт[а-яё]*|подпункт[а-яё]*)\s*({_NUM})",
+    re.IGNORECASE,
+)
+# Между номером статьи и пунктом допускается только название кодекса
+_PART_GAP_RE = re.compile(r"^[\s,]*(?:(?:нк|коап)(?:\s*рф)?)?[\s,]*$", re.IGNORECASE)
+_CODE_TAX_RE = re.compile(r"\bнк\b|налогов[а-яё]*\s+кодекс", re.IGNORECASE)
+_CODE_KOAP_RE = re.compile(r"коап|административн[а-яё]*\s+правонарушен", re.IGNORECASE)
+
+_BEFORE_WINDOW = 25
+_AFTER_WINDOW = 30
+
+
+class ArticleRef(NamedTuple):
+    number: str
+    part: str = ""
+    code: str = ""
+
+
+class ArticleMatch(NamedTuple):
+    ref: ArticleRef
+    code: str
+    title: str
+    text: str
+
+
+def _detect_code(fragment: str) -> str:
+    if _CODE_KOAP_RE.search(fragment):
+        return "koap"
+    if _CODE_TAX_RE.search(fragment):
+        return "tax"
+    return ""
+
+
+def parse_article_refs(query: str) -> list[ArticleRef]:
+    """
+    Находит в запросе ссылки на статьи, их части/пункты и кодекс.
+
+    >>> [r.number for r in parse_article_refs("ст. 280 и 284.")]
+    ['280', '284']
+    >>> [r.number for r in parse_article_refs("статьи 346.12, 346.13 и 346.14 НК")]
+    ['346.12', '346.13', '346.14']
+    >>> [r.number for r in parse_article_refs("ст. 15.25 и 3 года")]
+    ['15.25']
+    """
+    refs: list[ArticleRef] = []
+    for match in _ARTICLE_REF_RE.finditer(query):
+        numbers = [match.group(1)]
+        end = match.end()
+        while len(numbers) < MAX_REFS:
+            more = _ENUM_RE.match(query, end)
+            if not more:
+                break
+            numbers.append(more.group(1))
+            end = more.end()
+        before = query[max(0, match.start() - _BEFORE_WINDOW):match.start()]
+        after = query[end:end + _AFTER_WINDOW]
+        # Следующая ссылка на статью ограничивает «хвост» текущей
+        next_ref = _ARTICLE_REF_RE.search(after)
+        if next_ref:
+            after = after[:next_ref.start()]
+
+        # Пункт перед ссылкой относится к первой статье перечисления, после — к последней
+        parts = [""] * len(numbers)
+        part_after = _PART_RE.search(after)
+        if part_after and not _PART_GAP_RE.match(after[:part_after.start()]):
+            part_after = None
+        parts_before = list(_PART_RE.finditer(before))
+        if part_after:
+            parts[-1] = part_after.group(1)
+        elif parts_before and not before[parts_before[-1].end():].strip(" ,"):
+            parts[0] = parts_before[-1].group(1)
+
+        code = _detect_code(after)
+        for number, part in zip(numbers, parts):
+            ref = ArticleRef(number=number, part=part, code=code)
+            if ref not in refs:
+                refs.append(ref)
+        if len(refs) >= MAX_REFS:
+            refs = refs[:MAX_REFS]
+            break
+
+    if refs:
+        # «ст. 280 и 284 НК РФ»: кодекс, указанный один раз, относится ко всем ссылкам
+        query_code = _detect_code(query)
+        refs = [r._replace(code=r.code or query_code) for r in refs]
+    return refs
+
+
+def _split_articles(text: str) -> dict[str, tuple[str, str]]:
+    articles: dict[str, tuple[str, str]] = {}
+    number = ""
+    title = ""
+    body: list[str] = []
+
+    def flush():
+        if number and number not in articles:
+            articles[number] = (title, "\n\n".join(body).strip())
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = ARTICLE_RE.match(line)
+        if match:
+            flush()
+            number, title, body = match.group(1), match.group(2).strip(), []
+            continue
+        if CHAPTER_RE.match(line) or SECTION_RE.match(line):
+            flush()
+            number, title, body = "", "", []
+            continue
+        if number:
+            body.append(line)
+    flush()
+    return articles
+
+
+def extract_part(text: str, part: str) -> str:
+    """Возвращает пункт/часть статьи (абзацы от «17.2.» до следующего пункта)."""
+    paragraphs = text.split("\n\n")
+    start = -1
+    for idx, para in enumerate(paragraphs):
+        if re.match(rf"{re.escape(part)}[.)]\s", para):
+            start = idx
+            break
+    if start == -1:
+        return ""
+    depth = part.count(".")
+    collected = [paragraphs[start]]
+    for para in paragraphs[start + 1:]:
+        head = re.match(r"(\d+(?:\.\d+)*)[.)]\s", para)
+        if head and head.group(1).count(".") <= depth:
+            break
+        collected.append(para)
+    return "\n\n".join(collected)
+
+
+class ArticleIndex:
+    """Словарь «тема → номер статьи → (заголовок, текст)» по файлам data/."""
+
+    def __init__(self, data_dir: str, law_files: dict[str, str]):
+        self.data_dir = data_dir
+        self.law_files = law_files
+        self._articles: dict[str, dict[str, tuple[str, str]]] = {}
+        self._mtimes: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, topic: str) -> dict[str, tuple[str, str]]:
+        path = os.path.join(self.data_dir, self.law_files.get(topic, ""))
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+        with self._lock:
+            if self._mtimes.get(topic) != mtime:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._articles[topic] = _split_articles(f.read())
+                    self._mtimes[topic] = mtime
+                    logger.info(f"Article index for '{topic}': {len(self._articles[topic])} articles")
+                except Exception as e:
+                    logger.error(f"Error indexing law file {path}: {e}")
+                    self._articles[topic] = {}
+            return self._articles.get(topic, {})
+
+    def warm_up(self):
+        for topic in self.law_files:
+            self._load(topic)
+
+    def articles(self, topic: str) -> dict[str, tuple[str, str]]:
+        return self._load(topic)
+
+    def get(self, topic: str, number: str) -> tuple[str, str] | None:
+        return self._load(topic).get(number)
+
+    def lookup(self, query: str, topic: str) -> list[ArticleMatch]:
+        """Разрешает ссылки из запроса; без явного кодекса сначала ищет в теме запроса."""
+        matches: list[ArticleMatch] = []
+        for ref in parse_article_refs(query):
+            candidates = [ref.code] if ref.code else [topic] + [t for t in self.law_files if t != topic]
+            for code in candidates:
+                found = self.get(code, ref.number)
+                if found:
+                    title, text = found
+                    matches.append(ArticleMatch(ref=ref, code=code, title=title, text=text))
+                    break
+        return matches
+
+
+def format_articles(matches: list[ArticleMatch], max_chars: int) -> str:
+    blocks: list[str] = []
+    for m in matches:
+        label = CODE_LABELS.get(m.code, m.code)
+        title = f". {m.title}" if m.title else ""
+        header = f"Статья {m.ref.number}{title} ({label})"
+        text = m.text
+        if m.ref.part:
+            part_text = extract_part(m.text, m.ref.part)
+            if part_text:
+                header = f"{header}, п./ч. {m.ref.part}"
+                text = part_text
+        if len(text) > max_chars:
+            text = text[:max_chars]
+        blocks.append(f"{header}\n\n{text}".strip())
+    return "\n\n---\n\n".join(blocks)
+
+
+article_index = ArticleIndex(config.DATA_DIR, config.LAW_FILES)
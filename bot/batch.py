@@ -0,0 +1,124 @@
+"""
+Пакетная подготовка ответов на частые вопросы (FAQ) вне часов пик.
+
+Вопросы читаются из JSONL (строка — объект с полем "question") и проходят
+тот же путь, что и в боте: тема → нормы → веб-поиск → промпт → модель
+(handlers.answer_offline), не более --concurrency вопросов одновременно.
+Каждый ответ сразу пишется в хранилище FAQ, поэтому прерванный прогон
+продолжается с того же места: свежие записи пропускаются, а
+перегенерируются только устаревшие (истек срок или обновился корпус).
+
+Запуск:
+    python -m bot.batch questions.jsonl [--concurrency 4] [--force] [--limit N]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from bot.accounting import accountant
+from bot.config import config
+from bot.faq import faq_store
+from bot.handlers import answer_offline
+from bot.lifecycle import shutdown, startup
+from bot.logs import new_request_id, redact, request_id, setup_logging
+from bot.query_norm import cache_key
+
+logger = logging.getLogger(__name__)
+
+# Пакетные вызовы учитываются в usage.sqlite3 отдельно от пользователей
+BATCH_USER_ID = 0
+
+
+def read_questions(path: str) -> list[str]:
+    """Вопросы из JSONL без повторов (по ключу FAQ)."""
+    questions: list[str] = []
+    seen: set[str] = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                question = str(json.loads(line)["question"]).strip()
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"{path}:{line_no}: skipped ({e!r})")
+                continue
+            key = cache_key(question)
+            if question and key not in seen:
+                seen.add(key)
+                questions.append(question)
+    return questions
+
+
+async def answer_one(question: str) -> bool:
+    request_id.set(new_request_id())
+    with accountant.track(BATCH_USER_ID, kind="batch") as usage:
+        topic, answer, web = await answer_offline(question)
+        usage.topic = topic
+        # Ошибки и таймауты модели приходят текстом и отмечаются статусом — такие ответы не сохраняем
+        if usage.status != "ok" or not usage.llm_calls:
+            if usage.status == "ok":
+                usage.status = "error"
+            logger.error("No answer for %s (%s): %r", redact(question), usage.status, answer[:120])
+            return False
+        await asyncio.to_thread(faq_store.put, question, topic, answer, web, usage.model)
+        return True
+
+
+async def run_batch(questions: list[str], concurrency: int) -> tuple[int, int]:
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for question in questions:
+        queue.put_nowait(question)
+    done = failed = 0
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal done, failed
+        while not queue.empty():
+            question = queue.get_nowait()
+            try:
+                ok = await answer_one(question)
+            except Exception as e:
+                logger.error(f"Batch question failed: {e!r}")
+                ok = False
+            done += ok
+            failed += not ok
+            logger.info(
+                f"Batch progress: {done + failed}/{len(questions)} "
+                f"({failed} failed, {time.perf_counter() - started:.0f}s)"
+            )
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return done, failed
+
+
+async def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетная подготовка ответов FAQ")
+    parser.add_argument("questions", help="JSONL с полем question")
+    parser.add_argument("--concurrency", type=int, default=config.FAQ_BATCH_CONCURRENCY)
+    parser.add_argument("--force", action="store_true", help="перегенерировать и свежие записи")
+    parser.add_argument("--limit", type=int, default=0, help="не больше N вопросов за прогон")
+    args = parser.parse_args(argv)
+
+    # Индексы и FAQ нужны до отбора вопросов — прогреваем сразу, без STARTUP_LAZY
+    await startup(lazy=False)
+    try:
+        if not config.FAQ_ENABLED:
+            # В боте FAQ выключен, но хранилище для пакетного режима все равно нужно
+            await asyncio.to_thread(faq_store.load)
+        questions = read_questions(args.questions)
+        stale = [q for q in questions if args.force or not faq_store.is_fresh(faq_store.get(q))]
+        todo = stale[:args.limit] if args.limit else stale
+        logger.info(f"Batch: {len(questions)} questions, {len(questions) - len(stale)} fresh, {len(todo)} to answer")
+        done, failed = await run_batch(todo, args.concurrency)
+        logger.info(f"Batch finished: {done} answered, {failed} failed")
+        return 1 if failed else 0
+    finally:
+        await shutdown()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    raise SystemExit(asyncio.run(main()))
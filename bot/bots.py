@@ -0,0 +1,126 @@
+"""
+Несколько Telegram-ботов в одном процессе.
+
+Боты описываются в BOTS_FILE (без него — один бот с TELEGRAM_BOT_TOKEN) и
+работают через один диспетчер, один пул соединений к Bot API и общие
+индексы законов, кэш Tavily, FAQ и клиент модели. Middleware ставит
+профиль бота текущего апдейта в contextvar: config отдает его
+переопределения (контакт в дисклеймере, модель, домены поиска), учет
+пишет метрики с именем бота, а состояние пользователей (история,
+документы, выполняющиеся запросы) хранится по ключу user_key — у одного
+и того же пользователя в разных ботах оно не пересекается.
+"""
+import json
+import logging
+import os
+import re
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.enums import ParseMode
+from aiogram.types import TelegramObject
+
+from bot.config import DEFAULT_BOT, BotProfile, Config, bot_name, config, current_bot
+from bot.logs import new_request_id, request_id
+
+logger = logging.getLogger(__name__)
+
+_NAME_RE = re.compile(r"[a-z0-9_-]{1,32}")
+
+# Ключ состояния пользователя: (имя бота, id пользователя в Telegram)
+UserKey = tuple[str, int]
+
+
+def user_key(user_id: int) -> UserKey:
+    return bot_name(), user_id
+
+
+def _coerce(name: str, value: Any) -> Any:
+    """Приводит значение из BOTS_FILE к типу настройки в Config."""
+    default = getattr(Config, name)
+    if isinstance(default, bool):
+        return value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes")
+    if isinstance(default, list):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return [str(item) for item in value]
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+    return "" if value is None else str(value)
+
+
+def _profile(raw: dict) -> BotProfile:
+    name = str(raw.get("name", "")).strip().lower()
+    if not _NAME_RE.fullmatch(name):
+        raise ValueError(f"Bot name must match {_NAME_RE.pattern}: {name!r}")
+    token = raw.get("token") or os.getenv(raw.get("token_env") or "")
+    if not token:
+        raise ValueError(f"Bot '{name}': token or token_env is required")
+    overrides: dict[str, Any] = {}
+    for key, value in (raw.get("overrides") or {}).items():
+        if key not in Config.BOT_SETTINGS:
+            raise ValueError(f"Bot '{name}': setting {key} can not be overridden per bot")
+        overrides[key] = _coerce(key, value)
+    return BotProfile(name, token, overrides)
+
+
+def load_profiles() -> list[BotProfile]:
+    """Боты из BOTS_FILE или один бот с TELEGRAM_BOT_TOKEN."""
+    if not config.BOTS_FILE:
+        return [BotProfile(DEFAULT_BOT, config.TELEGRAM_BOT_TOKEN)] if config.TELEGRAM_BOT_TOKEN else []
+    with open(config.BOTS_FILE, "r", encoding="utf-8") as f:
+        profiles = [_profile(raw) for raw in json.load(f)]
+    names = [p.name for p in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate bot names in {config.BOTS_FILE}")
+    for profile in profiles:
+        logger.info(f"Bot '{profile.name}': overrides {sorted(profile.overrides) or '-'}")
+    return profiles
+
+
+def webhook_path(profile: BotProfile) -> str:
+    # Бот без BOTS_FILE остается на прежнем пути
+    return f"/webhook/{profile.name}" if config.BOTS_FILE else "/webhook"
+
+
+def create_bots(profiles: list[BotProfile]) -> list[tuple[Bot, BotProfile]]:
+    """Bot на каждый профиль; все ходят в Bot API через одну HTTP-сессию."""
+    session = AiohttpSession()
+    bots: list[tuple[Bot, BotProfile]] = []
+    seen: dict[int, str] = {}
+    for profile in profiles:
+        bot = Bot(
+            token=profile.token,
+            session=session,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+        if bot.id in seen:
+            raise ValueError(f"Bot '{profile.name}' uses the same token as '{seen[bot.id]}'")
+        seen[bot.id] = profile.name
+        bots.append((bot, profile))
+    return bots
+
+
+class BotContextMiddleware(BaseMiddleware):
+    """Ставит профиль бота, получившего апдейт, и id запроса для логов на время его обработки."""
+
+    def __init__(self, bots: list[tuple[Bot, BotProfile]]):
+        self.profiles = {bot.id: profile for bot, profile in bots}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        bot = data.get("bot")
+        profile = self.profiles.get(bot.id) if bot is not None else None
+        token = current_bot.set(profile)
+        rid_token = request_id.set(new_request_id())
+        try:
+            return await handler(event, data)
+        finally:
+            request_id.reset(rid_token)
+            current_bot.reset(token)
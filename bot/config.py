@@ -1,4 +1,7 @@
 import os
+from contextvars import ContextVar
+from typing import Any
+
 from dotenv import load_dotenv
 
 # Загружаем переменные из .env
@@ -7,6 +10,11 @@ load_dotenv()
 class Config:
     # Telegram
     TELEGRAM_BOT_TOKEN: str | None = os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("BOT_TOKEN")
+    # Несколько ботов в одном процессе: JSON-файл со списком
+    # [{"name": ..., "token" или "token_env": ..., "overrides": {...}}]; пусто — один бот
+    BOTS_FILE: str = os.getenv("BOTS_FILE", "")
+    # Контакт консультанта в дисклеймере под ответом
+    DISCLAIMER_CONTACT: str = os.getenv("DISCLAIMER_CONTACT", "@CorporateLawyer")
 
     # OpenRouter
     OPENROUTER_API_KEY: str | None = os.getenv("OPENROUTER_API_KEY")
@@ -19,6 +27,14 @@ class Config:
     TAVILY_COUNTRY: str = os.getenv("TAVILY_COUNTRY", "Poland")
     TAVILY_START_DATE: str = os.getenv("TAVILY_START_DATE", "2024-01-01")
     TAVILY_END_DATE: str = os.getenv("TAVILY_END_DATE", "")
+    # Кэш результатов поиска (повторные вопросы не тратят вызовы Tavily)
+    SEARCH_CACHE_TTL: int = int(os.getenv("SEARCH_CACHE_TTL", "21600"))
+    SEARCH_CACHE_SIZE: int = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+    # Постобработка результатов: сжатие сниппетов и порог схожести дублей (0..1)
+    SEARCH_SNIPPET_MAX_CHARS: int = int(os.getenv("SEARCH_SNIPPET_MAX_CHARS", "700"))
+    SEARCH_DEDUP_THRESHOLD: float = float(os.getenv("SEARCH_DEDUP_THRESHOLD", "0.8"))
+    # Порог покрытия вопроса локальным корпусом, ниже которого включается веб-поиск
+    SEARCH_COVERAGE_THRESHOLD: float = float(os.getenv("SEARCH_COVERAGE_THRESHOLD", "0.5"))
     TAVILY_INCLUDE_DOMAINS: list[str] = [
         "pravo.gov.ru",
         "consultant.ru",
@@ -49,9 +65,153 @@ class Config:
         "koap": "koap_rf.txt",
         "ved": "ved_laws.txt",
     }
+    # Лимит текста одной статьи при точном поиске по номеру («ст. 280 НК РФ»)
+    MAX_ARTICLE_CHARS: int = int(os.getenv("MAX_ARTICLE_CHARS", "6000"))
+    # Исправление опечаток в вопросах: сколько самых частых слов корпуса
+    # попадает в словарь удалений (остальные слова корпуса считаются известными)
+    QUERY_SPELL_VOCAB: int = int(os.getenv("QUERY_SPELL_VOCAB", "10000"))
 
     # Настройки бота
     MAX_HISTORY_PAIRS: int = 2
+    # Старые реплики сворачиваются в сводку фиксированного размера;
+    # HISTORY_SUMMARY_MODEL — дешевая модель для сжатия (пусто — без модели, извлечением)
+    HISTORY_SUMMARY_CHARS: int = int(os.getenv("HISTORY_SUMMARY_CHARS", "1200"))
+    HISTORY_ANSWER_CHARS: int = int(os.getenv("HISTORY_ANSWER_CHARS", "1500"))
+    HISTORY_SUMMARY_MODEL: str = os.getenv("HISTORY_SUMMARY_MODEL", "")
+
+    # Сквозной бюджет ответа на вопрос (SLA), секунды. Этапы берут таймауты из остатка:
+    # поиск не залезает в резерв модели и отправки, дополнительные поиски и запасные
+    # модели пропускаются, если на них не хватает времени
+    REQUEST_SLA_SECONDS: float = float(os.getenv("REQUEST_SLA_SECONDS", "60"))
+    SEARCH_STAGE_SECONDS: float = float(os.getenv("SEARCH_STAGE_SECONDS", "20"))
+    SEARCH_TIMEOUT_SECONDS: float = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "15"))
+    SEARCH_EXTRA_MIN_SECONDS: float = float(os.getenv("SEARCH_EXTRA_MIN_SECONDS", "8"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "90"))
+    LLM_MIN_SECONDS: float = float(os.getenv("LLM_MIN_SECONDS", "20"))
+    LLM_FALLBACK_MIN_SECONDS: float = float(os.getenv("LLM_FALLBACK_MIN_SECONDS", "10"))
+    SEND_RESERVE_SECONDS: float = float(os.getenv("SEND_RESERVE_SECONDS", "5"))
+
+    # Новое сообщение, пока предыдущий вопрос еще обрабатывается: "cancel" — отменить
+    # старый запрос, "merge" — дать ему закончить и ответить на новый следом
+    QUERY_SUPERSEDE_POLICY: str = os.getenv("QUERY_SUPERSEDE_POLICY", "cancel")
+
+    # Учет токенов и поиска: SQLite, сброс пачками; дневные квоты (0 — без ограничения)
+    USAGE_DB_PATH: str = os.getenv("USAGE_DB_PATH", os.path.join("data", "usage.sqlite3"))
+    USAGE_FLUSH_SECONDS: float = float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+    USAGE_BATCH_SIZE: int = int(os.getenv("USAGE_BATCH_SIZE", "100"))
+    USER_DAILY_REQUESTS: int = int(os.getenv("USER_DAILY_REQUESTS", "0"))
+    USER_DAILY_TOKENS: int = int(os.getenv("USER_DAILY_TOKENS", "0"))
+
+    # Готовые ответы на частые вопросы (пакетный режим python -m bot.batch): срок годности
+    # записи, для ответов с веб-поиском — короче; сколько вопросов пакет готовит одновременно
+    FAQ_ENABLED: bool = os.getenv("FAQ_ENABLED", "1").lower() in ("1", "true", "yes")
+    FAQ_DB_PATH: str = os.getenv("FAQ_DB_PATH", os.path.join("data", "faq.sqlite3"))
+    FAQ_TTL_SECONDS: float = float(os.getenv("FAQ_TTL_SECONDS", str(7 * 24 * 3600)))
+    FAQ_WEB_TTL_SECONDS: float = float(os.getenv("FAQ_WEB_TTL_SECONDS", str(24 * 3600)))
+    FAQ_BATCH_CONCURRENCY: int = int(os.getenv("FAQ_BATCH_CONCURRENCY", "4"))
+
+    # Профилирование: доля сэмплируемых запросов, каталог снимков и ротация;
+    # PROFILE_TOKEN включает маршрут /debug/profile в webhook-режиме
+    PROFILE_ENABLED: bool = os.getenv("PROFILE_ENABLED", "0").lower() in ("1", "true", "yes")
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_KEEP: int = int(os.getenv("PROFILE_KEEP", "50"))
+    PROFILE_SAMPLER_INTERVAL: float = float(os.getenv("PROFILE_SAMPLER_INTERVAL", "0.005"))
+    PROFILE_TOKEN: str = os.getenv("PROFILE_TOKEN", "")
+
+    # Логи: уровень, формат ("json" или "text"), доля сохраняемых DEBUG-записей,
+    # скрытие текста пользователя ("hash" или "none") и размер очереди записи в stdout
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_DEBUG_SAMPLE_RATE: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.05"))
+    LOG_REDACT: str = os.getenv("LOG_REDACT", "hash")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # Холодный старт: прогрев индексов и клиента модели в фоне после запуска
+    STARTUP_LAZY: bool = os.getenv("STARTUP_LAZY", "0").lower() in ("1", "true", "yes")
+
+    # Пул процессов для обработки вложений
+    WORKER_PROCESSES: int = int(os.getenv("WORKER_PROCESSES", "2"))
+
+    # Изображения: принимаем крупные сканы, но в модель отправляем уменьшенную копию
+    IMAGE_MAX_INPUT_BYTES: int = int(os.getenv("IMAGE_MAX_INPUT_BYTES", str(15 * 1024 * 1024)))
+    IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", "1600"))
+    IMAGE_TARGET_BYTES: int = int(os.getenv("IMAGE_TARGET_BYTES", "150000"))
+    IMAGE_FORMAT: str = os.getenv("IMAGE_FORMAT", "WEBP")
+
+    # PDF: лимит файла (Bot API отдает до 20 МБ) и растеризация сканов без текстового слоя
+    # (скан — если первые PDF_RASTER_PAGES страниц дали меньше PDF_MIN_TEXT_CHARS символов)
+    PDF_MAX_BYTES: int = int(os.getenv("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+    PDF_RASTER_PAGES: int = int(os.getenv("PDF_RASTER_PAGES", "2"))
+    PDF_RASTER_DPI: int = int(os.getenv("PDF_RASTER_DPI", "150"))
+    PDF_MIN_TEXT_CHARS: int = int(os.getenv("PDF_MIN_TEXT_CHARS", "50"))
+
+    # Локальный OCR (нужен tesseract с языковым пакетом rus); выключен по умолчанию
+    OCR_ENABLED: bool = os.getenv("OCR_ENABLED", "0").lower() in ("1", "true", "yes")
+    OCR_LANG: str = os.getenv("OCR_LANG", "rus+eng")
+    # Ниже этой средней уверенности (0..100) в модель дополнительно уходит само изображение
+    OCR_MIN_CONFIDENCE: float = float(os.getenv("OCR_MIN_CONFIDENCE", "70"))
+    OCR_MIN_CHARS: int = int(os.getenv("OCR_MIN_CHARS", "40"))
+    OCR_TIMEOUT: float = float(os.getenv("OCR_TIMEOUT", "30"))
+
+    # Настройки, которые бот может переопределить в BOTS_FILE. Остальные общие для
+    # процесса: ключи API, пулы соединений, кэши, индексы и хранилища создаются один раз
+    BOT_SETTINGS: tuple[str, ...] = (
+        "DISCLAIMER_CONTACT",
+        "MODEL_NAME",
+        "MODEL_FALLBACKS",
+        "HISTORY_SUMMARY_MODEL",
+        "TAVILY_INCLUDE_DOMAINS",
+        "TAVILY_COUNTRY",
+        "TAVILY_SEARCH_DEPTH",
+        "TAVILY_MAX_RESULTS",
+        "TAVILY_START_DATE",
+        "TAVILY_END_DATE",
+        "SEARCH_COVERAGE_THRESHOLD",
+        "REQUEST_SLA_SECONDS",
+        "USER_DAILY_REQUESTS",
+        "USER_DAILY_TOKENS",
+        "FAQ_ENABLED",
+        "OCR_ENABLED",
+    )
+
+
+DEFAULT_BOT = "default"
+
+
+class BotProfile:
+    """Бот, которого обслуживает процесс: имя (для пути webhook и метрик), токен, свои настройки."""
+
+    def __init__(self, name: str, token: str | None, overrides: dict[str, Any] | None = None):
+        self.name = name
+        self.token = token
+        self.overrides = overrides or {}
+
+
+# Бот, чей апдейт сейчас обрабатывается (ставит middleware из bot/bots.py)
+current_bot: ContextVar[BotProfile | None] = ContextVar("current_bot", default=None)
+
+
+def bot_name() -> str:
+    bot = current_bot.get()
+    return bot.name if bot is not None else DEFAULT_BOT
+
+
+class BotConfig:
+    """Config с переопределениями бота текущего апдейта поверх общих значений."""
+
+    def __init__(self, base: Config):
+        object.__setattr__(self, "_base", base)
+
+    def __getattr__(self, name: str) -> Any:
+        bot = current_bot.get()
+        if bot is not None and name in bot.overrides:
+            return bot.overrides[name]
+        return getattr(self._base, name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._base, name, value)
+
 
 # ВАЖНО: именно этот объект мы импортируем в main.py и других модулях
-config = Config()
+config = BotConfig(Config())
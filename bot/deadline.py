@@ -0,0 +1,57 @@
+"""
+Сквозной бюджет времени на ответ (SLA) для одного вопроса.
+
+Deadline создается, когда вопрос принят в работу, и доступен этапам
+через contextvar (как RequestUsage в accounting.py). Каждый этап — поиск,
+повтор запроса, модель и ее запасные варианты, отправка — берет себе
+таймаут из оставшегося бюджета, оставляя резерв следующим этапам, и
+пропускает необязательную работу, если времени мало.
+"""
+import time
+from contextvars import ContextVar
+
+from bot.config import config
+
+
+class Deadline:
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires = self.started + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def timeout(self, cap: float, reserve: float = 0.0) -> float:
+        """Таймаут этапа: не больше cap и не залезая в резерв следующих этапов."""
+        return max(0.0, min(cap, self.remaining() - reserve))
+
+    def allows(self, seconds: float, reserve: float = 0.0) -> bool:
+        """Хватит ли бюджета на работу длиной seconds с учетом резерва."""
+        return self.remaining() - reserve >= seconds
+
+
+current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+def stage_timeout(cap: float, reserve: float = 0.0) -> float:
+    """Таймаут этапа по бюджету текущего запроса; вне запроса — просто cap."""
+    deadline = current_deadline.get()
+    return cap if deadline is None else deadline.timeout(cap, reserve)
+
+
+def budget_allows(seconds: float, reserve: float = 0.0) -> bool:
+    deadline = current_deadline.get()
+    return deadline is None or deadline.allows(seconds, reserve)
+
+
+def search_reserve() -> float:
+    """Сколько бюджета поиск оставляет модели и отправке ответа."""
+    return config.LLM_MIN_SECONDS + config.SEND_RESERVE_SECONDS
+
+
+def new_deadline() -> Deadline:
+    return Deadline(config.REQUEST_SLA_SECONDS)
@@ -0,0 +1,106 @@
+"""
+Поиск по загруженным пользователем документам.
+
+Документ режется на фрагменты по абзацам, по фрагментам строится
+небольшой BM25-индекс в памяти, и в промпт попадают только фрагменты,
+относящиеся к текущему вопросу, а не начало документа целиком.
+"""
+import math
+import re
+from collections import Counter
+
+from bot.query_norm import query_terms, text_terms
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def split_chunks(text: str, chunk_chars: int) -> list[str]:
+    """Склеивает абзацы во фрагменты до chunk_chars; длинные абзацы режет по предложениям."""
+    pieces: list[str] = []
+    for para in re.split(r"\n\s*\n|\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if len(para) <= chunk_chars:
+            pieces.append(para)
+            continue
+        for sentence in _SENTENCE_RE.split(para):
+            while len(sentence) > chunk_chars:
+                pieces.append(sentence[:chunk_chars])
+                sentence = sentence[chunk_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) + 1 > chunk_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class DocumentIndex:
+    def __init__(self, text: str, chunk_chars: int):
+        self.chunks = split_chunks(text, chunk_chars)
+        self.total_chars = sum(len(c) for c in self.chunks)
+        self._tf = [Counter(text_terms(chunk)) for chunk in self.chunks]
+        self._lengths = [sum(tf.values()) for tf in self._tf]
+        self._avg_len = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        self._df: Counter = Counter()
+        for tf in self._tf:
+            self._df.update(tf.keys())
+
+    def search(self, query: str) -> list[tuple[int, float]]:
+        """Фрагменты по убыванию BM25 (только с ненулевым весом)."""
+        n = len(self.chunks)
+        q_terms = set(query_terms(query))
+        scores: list[tuple[int, float]] = []
+        for idx, tf in enumerate(self._tf):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[idx] / (self._avg_len or 1))
+            for term in q_terms:
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                df = self._df[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                score += idf * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((idx, score))
+        scores.sort(key=lambda pair: pair[1], reverse=True)
+        return scores
+
+    def context(self, query: str, max_chars: int) -> str:
+        """Релевантные фрагменты в порядке следования в документе, не длиннее max_chars."""
+        if self.total_chars <= max_chars:
+            return "\n".join(self.chunks)
+        ranked = [idx for idx, _ in self.search(query)]
+        if not ranked:
+            # Вопрос без совпадений («перескажи документ») — берем начало
+            ranked = list(range(len(self.chunks)))
+        picked: list[int] = []
+        size = 0
+        for idx in ranked:
+            length = len(self.chunks[idx]) + 7
+            if size + length > max_chars:
+                continue
+            picked.append(idx)
+            size += length
+        picked.sort()
+        parts: list[str] = []
+        prev = -1
+        for idx in picked:
+            if prev != -1 and idx != prev + 1:
+                parts.append("[...]")
+            parts.append(self.chunks[idx])
+            prev = idx
+        return "\n".join(parts)
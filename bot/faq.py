@@ -0,0 +1,194 @@
+"""
+Хранилище заранее подготовленных ответов на частые вопросы (FAQ).
+
+Ответы готовит пакетный режим (python -m bot.batch) вне часов пик, а
+process_query ищет вопрос здесь до поиска и вызова модели. Ключ — тот же
+нормализованный вид вопроса, что у кэша поиска (cache_key), поэтому
+опечатки, ё/е и синонимы не плодят разные записи.
+
+Записи лежат в SQLite (ответ сжат zlib) и загружаются в память при старте.
+Пакетный режим пишет в ту же базу из другого процесса, поэтому бот
+перечитывает ее, когда меняется файл, а запись, которой нет в памяти или
+которая там устарела, перед промахом перечитывает из базы. У каждой записи
+есть срок годности (короче для ответов с веб-поиском) и отпечаток корпуса
+законов: после обновления data/ или по истечении срока запись считается
+устаревшей, не отдается пользователям и перегенерируется пакетным режимом.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import NamedTuple
+
+from bot.config import config
+from bot.query_norm import cache_key
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS faq (
+    key TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    answer BLOB NOT NULL,
+    web INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    corpus TEXT NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class FaqEntry(NamedTuple):
+    key: str
+    question: str
+    topic: str
+    answer: bytes
+    web: bool
+    model: str
+    corpus: str
+    created: float
+    expires: float
+
+    @property
+    def text(self) -> str:
+        return zlib.decompress(self.answer).decode("utf-8")
+
+
+def corpus_version() -> str:
+    """Отпечаток файлов законов: меняется, когда корпус в data/ обновили."""
+    parts = []
+    for name in sorted(config.LAW_FILES.values()):
+        try:
+            stat = os.stat(os.path.join(config.DATA_DIR, name))
+            parts.append(f"{name}:{stat.st_size}:{int(stat.st_mtime)}")
+        except OSError:
+            parts.append(f"{name}:-")
+    return ",".join(parts)
+
+
+class FaqStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._entries: dict[str, FaqEntry] = {}
+        self._corpus = ""
+        # (mtime_ns, размер) файла базы на момент загрузки
+        self._stamp: tuple[int, int] | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _file_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _entry(row: tuple) -> FaqEntry:
+        return FaqEntry(*row[:4], bool(row[4]), *row[5:])
+
+    def load(self):
+        """Читает все записи в память (вызывается из потока)."""
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    stamp = self._file_stamp()
+                    rows = conn.execute(f"SELECT {', '.join(FaqEntry._fields)} FROM faq").fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"FAQ load error: {e}")
+                return
+            self._entries = {row[0]: self._entry(row) for row in rows}
+            self._corpus = corpus_version()
+            self._stamp = stamp
+        fresh = sum(1 for entry in self._entries.values() if self.is_fresh(entry))
+        logger.info(f"FAQ store loaded: {len(self._entries)} entries, {fresh} fresh")
+
+    def refresh(self):
+        """Перечитывает базу, если ее изменил другой процесс (пакетный режим)."""
+        self._corpus = corpus_version()
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self._stamp:
+            self.load()
+
+    def _read(self, key: str) -> FaqEntry | None:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    f"SELECT {', '.join(FaqEntry._fields)} FROM faq WHERE key = ?", (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"FAQ read error: {e}")
+            return None
+        if row is None:
+            return None
+        entry = self._entry(row)
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def is_fresh(self, entry: FaqEntry | None, now: float | None = None) -> bool:
+        if entry is None:
+            return False
+        return entry.expires > (now or time.time()) and entry.corpus == self._corpus
+
+    def get(self, question: str) -> FaqEntry | None:
+        return self._entries.get(cache_key(question))
+
+    def lookup(self, question: str) -> FaqEntry | None:
+        """Свежий готовый ответ на вопрос или None (читает файл базы — вызывать из потока)."""
+        self.refresh()
+        if self._stamp is None:
+            # Базы еще нет: пакетный режим ни разу не запускался
+            return None
+        key = cache_key(question)
+        entry = self._entries.get(key)
+        if not self.is_fresh(entry):
+            # Пакетный прогон мог обновить запись уже после загрузки
+            entry = self._read(key)
+            if not self.is_fresh(entry):
+                return None
+        self.hits += 1
+        return entry
+
+    def put(self, question: str, topic: str, answer: str, web: bool, model: str) -> FaqEntry:
+        """Сохраняет ответ сразу в базу: прерванный пакетный прогон продолжится с того же места."""
+        now = time.time()
+        ttl = config.FAQ_WEB_TTL_SECONDS if web else config.FAQ_TTL_SECONDS
+        entry = FaqEntry(
+            cache_key(question), question, topic, zlib.compress(answer.encode("utf-8"), 9),
+            web, model, self._corpus or corpus_version(), now, now + ttl,
+        )
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO faq VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (*entry[:4], int(entry.web), *entry[5:]),
+                    )
+            finally:
+                conn.close()
+            self._entries[entry.key] = entry
+            # Свою запись перечитывать не нужно
+            self._stamp = self._file_stamp()
+        return entry
+
+
+faq_store = FaqStore(config.FAQ_DB_PATH)
@@ -7,28 +7,55 @@ import logging
 import shutil
 import subprocess
 import tempfile
+import time
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import CommandStart, Command
 
+from bot.accounting import RequestUsage, accountant, record_llm_failure
+from bot.articles import ArticleMatch, ArticleRef, article_index, format_articles
+from bot.bots import UserKey, user_key
 from bot.config import config
+from bot.deadline import current_deadline, new_deadline, search_reserve, stage_timeout
+from bot.doc_index import DocumentIndex
+from bot.faq import FaqEntry, faq_store
+from bot.images import prepare_image
+from bot.ocr import extract_text, is_confident
+from bot.pdf import read_pdf
 from bot.router import detect_topic
 from bot.search import get_tavily_search
-from bot.llm import llm_client
+from bot.search_gate import corpus_coverage, decide_web_search, log_decision
+from bot.llm import LLM_TIMEOUT_MESSAGE, llm_client
+from bot.pipeline import Pipeline
+from bot.profiling import profiler
 from bot.storage import conversation_storage
+from bot.tasks import user_tasks
+from bot.telegram_html import format_html
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = Router()
 
-doc_text_by_user: dict[int, str] = {}
-doc_images_by_user: dict[int, list[str]] = {}
+# Состояние пользователя хранится по user_key: у разных ботов процесса оно свое
+doc_text_by_user: dict[UserKey, str] = {}
+doc_index_by_user: dict[UserKey, DocumentIndex] = {}
+doc_images_by_user: dict[UserKey, list[str]] = {}
 
-MAX_DOC_BYTES = 200_000
+# Фоновые задачи (сжатие истории): держим ссылки, чтобы их не собрал GC
+_background_tasks: set[asyncio.Task] = set()
+
+MAX_DOC_BYTES = 5_000_000
+# Без Pillow изображения уходят в модель как есть, поэтому лимит меньше
+MAX_RAW_IMAGE_BYTES = 200_000
+# Сколько текста документа попадает в промпт за один вопрос
 MAX_DOC_CHARS = 8_000
+# Сколько текста документа индексируется для поиска фрагментов
+MAX_DOC_INDEX_CHARS = 500_000
+DOC_CHUNK_CHARS = 1_200
 MAX_IMAGE_ITEMS = 2
-TELEGRAM_MAX_LEN = 4096
+# Нормы в промпте, если в вопросе нет номера статьи: лучшие по покрытию статьи темы
+COVERED_ARTICLES = 5
+MAX_LAW_CONTEXT_CHARS = 50_000
 
 SEARCH_STATUSES = [
     "🔍 Изучаю законодательную базу...",
@@ -44,45 +71,18 @@ GENERATING_STATUSES = [
     "✍️ Пишу ответ...",
 ]
 
-SEARCH_KEYWORDS = [
-    "санкц",
-    "ндпи",
-    "налог",
-    "изменени",
-    "закон",
-    "указ",
-    "постановлен",
-    "судебн",
-    "практик",
-    "нк рф",
-    "минфин",
-    "фнс",
-    "доля",
-    "участи",
-    "уставн",
-    "иностранн",
-    "нерезидент",
-    "валютн",
-    "cbr",
-    "центробанк",
-    "письмо",
-    "разъяснен",
-    "льгот",
-    "освобожден",
-    "недвижим",
-    "актив",
-    "прибыл",
-]
-
 @router.message(CommandStart())
 async def cmd_start(message: Message):
-    conversation_storage.clear_history(message.from_user.id)
-    doc_text_by_user.pop(message.from_user.id, None)
-    doc_images_by_user.pop(message.from_user.id, None)
+    key = user_key(message.from_user.id)
+    user_tasks.cancel(key, "start")
+    conversation_storage.clear_history(key)
+    doc_text_by_user.pop(key, None)
+    doc_index_by_user.pop(key, None)
+    doc_images_by_user.pop(key, None)
     await message.answer(
         "Здравствуйте! Я консультант по налогам в РФ.\n\n"
         "Опишите вашу ситуацию или задайте вопрос — отвечу по сути.\n"
-        "Можно прислать текст, фото, DOCX или DOC — я учту это в ответах.\n\n"
+        "Можно прислать текст, фото, PDF, DOCX или DOC — я учту это в ответах.\n\n"
         "Примеры:\n"
         "• Налог на имущество для физлиц в моем случае\n"
         "• У меня ИП на УСН, что с НДС?\n"
@@ -92,9 +92,12 @@ async def cmd_start(message: Message):
 
 @router.message(Command("clear"))
 async def cmd_clear(message: Message):
-    conversation_storage.clear_history(message.from_user.id)
-    doc_text_by_user.pop(message.from_user.id, None)
-    doc_images_by_user.pop(message.from_user.id, None)
+    key = user_key(message.from_user.id)
+    user_tasks.cancel(key, "clear")
+    conversation_storage.clear_history(key)
+    doc_text_by_user.pop(key, None)
+    doc_index_by_user.pop(key, None)
+    doc_images_by_user.pop(key, None)
     await message.answer("🧹 Контекст диалога очищен.")
 
 def _safe_trim(text: str, limit: int) -> str:
@@ -120,6 +123,18 @@ def _is_doc_file(file_name: str, mime_type: str) -> bool:
     mime_type = (mime_type or "").lower()
     return file_name.endswith(".doc") or mime_type == "application/msword"
 
+def _is_pdf_file(file_name: str, mime_type: str) -> bool:
+    file_name = (file_name or "").lower()
+    mime_type = (mime_type or "").lower()
+    return file_name.endswith(".pdf") or mime_type == "application/pdf"
+
+def _max_document_bytes(file_name: str, mime_type: str) -> int:
+    if _is_image_file(file_name, mime_type):
+        return config.IMAGE_MAX_INPUT_BYTES
+    if _is_pdf_file(file_name, mime_type):
+        return config.PDF_MAX_BYTES
+    return MAX_DOC_BYTES
+
 def _to_data_url(data: bytes, mime_type: str) -> str:
     b64 = base64.b64encode(data).decode("ascii")
     return f"data:{mime_type};base64,{b64}"
@@ -173,99 +188,320 @@ def _read_doc_bytes(data: bytes) -> tuple[str, str | None]:
             except Exception:
                 pass
 
+async def _image_to_data_url(data: bytes, mime_type: str, as_document: bool = False) -> str:
+    """Уменьшает и перекодирует изображение; без Pillow берет исходник, если он небольшой."""
+    if len(data) > config.IMAGE_MAX_INPUT_BYTES:
+        return ""
+    try:
+        prepared = await prepare_image(data, as_document)
+    except Exception as e:
+        logger.error(f"Image worker error: {e}")
+        prepared = None
+    if prepared:
+        encoded, encoded_mime = prepared
+        logger.info(f"Image re-encoded: {len(data)} -> {len(encoded)} bytes ({encoded_mime})")
+        return _to_data_url(encoded, encoded_mime)
+    if len(data) <= MAX_RAW_IMAGE_BYTES:
+        return _to_data_url(data, mime_type)
+    return ""
+
+async def _read_image(user_id: int, data: bytes, mime_type: str, as_document: bool = False) -> tuple[str, str]:
+    """Текст из OCR или data URL изображения: картинка уходит в модель только при неуверенном OCR."""
+    if config.OCR_ENABLED:
+        try:
+            result = await extract_text(data)
+            logger.info(
+                f"OCR: {len(result.text)} chars, confidence {result.confidence:.0f}"
+                + (f", error {result.error}" if result.error else "")
+            )
+            if is_confident(result):
+                return _safe_trim(result.text, MAX_DOC_INDEX_CHARS), ""
+        except Exception as e:
+            logger.error(f"OCR worker error: {e}")
+
+    image_url = await _image_to_data_url(data, mime_type, as_document=as_document)
+    if image_url:
+        _store_user_image(user_id, image_url)
+    return "", image_url
+
+async def _read_pdf_document(message: Message) -> tuple[str, str]:
+    """Текст PDF (постранично, до MAX_DOC_INDEX_CHARS); для сканов — OCR/изображения первых страниц."""
+    tmp_path = ""
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp_path = tmp.name
+        await message.bot.download(message.document, destination=tmp_path)
+        result = await read_pdf(tmp_path, MAX_DOC_INDEX_CHARS)
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
+
+    logger.info(
+        f"PDF: {result.pages_read}/{result.total_pages} pages read, {len(result.text)} chars, "
+        f"{len(result.page_images)} rasterized" + (f", error {result.error}" if result.error else "")
+    )
+    if not result.page_images:
+        return _safe_trim(result.text, MAX_DOC_INDEX_CHARS), ""
+
+    texts = [result.text] if result.text else []
+    image_url = ""
+    for page in result.page_images[:MAX_IMAGE_ITEMS]:
+        page_text, page_url = await _read_image(message.from_user.id, page, "image/png", as_document=True)
+        if page_text:
+            texts.append(page_text)
+        image_url = page_url or image_url
+    return _safe_trim("\n\n".join(texts), MAX_DOC_INDEX_CHARS), image_url
+
 def _store_user_image(user_id: int, data_url: str):
-    images = doc_images_by_user.get(user_id, [])
+    key = user_key(user_id)
+    images = doc_images_by_user.get(key, [])
     images.append(data_url)
     if len(images) > MAX_IMAGE_ITEMS:
         images = images[-MAX_IMAGE_ITEMS:]
-    doc_images_by_user[user_id] = images
+    doc_images_by_user[key] = images
 
-def _split_message(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[str]:
-    if len(text) <= limit:
-        return [text]
-    parts: list[str] = []
-    remaining = text
-    while len(remaining) > limit:
-        cut = remaining.rfind("\n", 0, limit + 1)
-        if cut == -1:
-            cut = remaining.rfind(" ", 0, limit + 1)
-        if cut == -1 or cut < limit * 0.3:
-            cut = limit
-        parts.append(remaining[:cut].strip())
-        remaining = remaining[cut:].lstrip()
-    if remaining:
-        parts.append(remaining)
-    return parts
-
-def needs_web_search(user_query: str) -> bool:
-    q = user_query.strip().lower()
-    if not q:
-        return False
-    if len(q) > 80:
-        return True
-    return any(word in q for word in SEARCH_KEYWORDS)
+def needs_web_search(user_query: str, topic: str = "tax", has_exact_article: bool = False) -> bool:
+    decision = decide_web_search(user_query, topic, has_exact_article=has_exact_article)
+    log_decision(decision)
+    return decision.search
 
 def _append_disclaimer(answer: str) -> str:
     disclaimer = (
         "\n\nОтвет сгенерирован ИИ и не является официальной консультацией. "
         "Для принятия решений по сделкам, подаче деклараций или спорам с налоговыми органами "
-        "обратитесь к квалифицированному налоговому консультанту @CorporateLawyer."
+        f"обратитесь к квалифицированному налоговому консультанту {config.DISCLAIMER_CONTACT}."
     )
     if "Ответ сгенерирован ИИ" in answer:
         return answer
     return answer.rstrip() + disclaimer
 
+def _retrieve_law(user_query: str) -> tuple[str, bool, str]:
+    """Тема, признак точного совпадения статьи и контекст норм для промпта."""
+    topic = detect_topic(user_query)
+
+    articles = article_index.lookup(user_query, topic)
+    if articles:
+        logger.info(f"Exact article match: {', '.join(m.ref.number for m in articles)}")
+        return topic, True, format_articles(articles, config.MAX_ARTICLE_CHARS)
+
+    # Статьи, лучше всего покрывающие вопрос, берутся из уже построенного индекса
+    # покрытия, а не из начала многомегабайтного файла закона
+    covered = []
+    for number in corpus_coverage.best_articles(user_query, topic, COVERED_ARTICLES):
+        found = article_index.get(topic, number)
+        if found:
+            covered.append(ArticleMatch(ArticleRef(number), topic, *found))
+    if covered:
+        law_context = format_articles(covered, config.MAX_ARTICLE_CHARS)
+        return topic, False, law_context[:MAX_LAW_CONTEXT_CHARS]
+
+    law_file = config.LAW_FILES.get(topic, config.LAW_FILES["tax"])
+    law_path = os.path.join(config.DATA_DIR, law_file)
+    law_context = ""
+    try:
+        if os.path.exists(law_path):
+            with open(law_path, "r", encoding="utf-8") as f:
+                law_context = f.read(MAX_LAW_CONTEXT_CHARS)
+    except Exception as e:
+        logger.error(f"Error reading law file: {e}")
+    return topic, False, law_context
+
+async def _store_document(user_id: int, text: str):
+    index = await asyncio.to_thread(DocumentIndex, text, DOC_CHUNK_CHARS)
+    doc_text_by_user[user_key(user_id)] = text
+    doc_index_by_user[user_key(user_id)] = index
+    logger.info(f"Document indexed: {len(text)} chars, {len(index.chunks)} chunks")
+
+def _document_context(user_id: int, user_query: str, extra_context: str) -> str:
+    """Фрагменты документа, относящиеся к вопросу, в пределах MAX_DOC_CHARS."""
+    index = doc_index_by_user.get(user_key(user_id))
+    if index is not None:
+        return index.context(user_query, MAX_DOC_CHARS)
+    return _safe_trim(extra_context, MAX_DOC_CHARS)
+
+def _build_history(user_id: int, user_query: str, extra_context: str) -> str:
+    history = conversation_storage.get_formatted_history(user_key(user_id))
+    doc_text = _document_context(user_id, user_query, extra_context)
+    if doc_text:
+        doc_block = f"Контекст из документа:\n{doc_text}"
+        history = f"{history}\n\n{doc_block}" if history else doc_block
+    return history
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def _compress_history(user_id: int):
+    key = user_key(user_id)
+    if not conversation_storage.pending.get(key):
+        return
+    try:
+        with accountant.track(user_id, kind="history_summary"):
+            await conversation_storage.compress(key, llm_client.summarize_history)
+    except Exception as e:
+        logger.error(f"History compression error: {e}")
+
+def _send_timeout() -> float:
+    deadline = current_deadline.get()
+    remaining = deadline.remaining() if deadline else config.SEND_RESERVE_SECONDS
+    return max(remaining, config.SEND_RESERVE_SECONDS)
+
+async def _faq_answer(user_id: int, user_query: str, extra_context: str) -> FaqEntry | None:
+    """Готовый ответ из FAQ; вопросы по документам и изображениям всегда идут в модель."""
+    if not config.FAQ_ENABLED or extra_context or doc_images_by_user.get(user_key(user_id)):
+        return None
+    # lookup сверяет файл базы и при промахе читает запись из SQLite — не в event loop
+    return await asyncio.to_thread(faq_store.lookup, user_query)
+
 async def process_query(message: Message, user_query: str, extra_context: str = ""):
     user_id = message.from_user.id
-    status_msg = await message.answer("⏳ Принял запрос, начинаю анализ...")
+    # Частые вопросы отвечаются из FAQ без поиска и модели (и не тратят квоту)
+    entry = await _faq_answer(user_id, user_query, extra_context)
+    if entry is not None:
+        await user_tasks.run(user_key(user_id), _faq_reply(message, user_query, entry))
+        return
+
+    # Квота проверяется до поиска и вызова модели
+    if accountant.check_quota(user_id):
+        logger.info(f"Daily quota exceeded for user {user_id}")
+        await message.answer("⚠️ Дневной лимит запросов исчерпан. Попробуйте завтра.")
+        return
+
+    # Новое сообщение отменяет (или ждет) еще не отвеченный вопрос пользователя
+    await user_tasks.run(user_key(user_id), _tracked_query(message, user_query, extra_context))
+
+async def _faq_reply(message: Message, user_query: str, entry: FaqEntry):
+    user_id = message.from_user.id
+    with accountant.track(user_id, kind="faq", topic=entry.topic):
+        # Дисклеймер добавляется при отправке: контакт в нем свой у каждого бота
+        answer = _append_disclaimer(entry.text)
+        logger.info(f"FAQ hit: topic={entry.topic} age={(time.time() - entry.created) / 3600:.1f}h")
+        conversation_storage.add_message(user_key(user_id), "user", user_query)
+        conversation_storage.add_message(user_key(user_id), "assistant", answer)
+        user_tasks.release(user_key(user_id))
+        for part in format_html(answer):
+            await asyncio.wait_for(message.answer(part), timeout=_send_timeout())
+        _run_in_background(_compress_history(user_id))
+
+async def answer_offline(user_query: str) -> tuple[str, str, bool]:
+    """
+    Ответ без диалога, статусов и бюджета времени (пакетный режим FAQ):
+    те же этапы — тема, нормы, веб-поиск, промпт, модель.
+
+    Возвращает тему, ответ без дисклеймера и признак того, что был веб-поиск.
+    Если модель не ответила, ответ — текст ошибки, а статус текущего учета
+    (accountant.track) — "timeout" или "error".
+    """
+    pipeline = Pipeline("offline")
+
+    async def retrieve():
+        return await asyncio.to_thread(_retrieve_law, user_query)
+
+    async def search(retrieval):
+        topic, has_exact_article, _ = retrieval
+        if not needs_web_search(user_query, topic, has_exact_article=has_exact_article):
+            return ""
+        try:
+            return await asyncio.wait_for(get_tavily_search(user_query), timeout=config.SEARCH_STAGE_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error("Tavily search timeout")
+        except Exception as e:
+            logger.error(f"Tavily search error: {e}")
+        return ""
+
+    pipeline.stage("retrieval", retrieve)
+    pipeline.stage("search", search, ("retrieval",))
+    try:
+        topic, _, law_context = await pipeline.result("retrieval")
+        web_results = await pipeline.result("search")
+        prompt = llm_client.build_prompt(
+            user_query=user_query,
+            law_context=law_context,
+            web_results=web_results,
+            history="",
+        )
+        answer = await pipeline.stage("llm", lambda: llm_client.generate_response(prompt))
+    finally:
+        pipeline.cancel()
+    logger.info(f"Offline pipeline timings: {pipeline.report()}")
+    return topic, answer, bool(web_results)
+
+async def _tracked_query(message: Message, user_query: str, extra_context: str):
+    # Бюджет времени отсчитывается, когда вопрос начали обрабатывать, а не когда
+    # он пришел: при политике «merge» вопрос может ждать ответа на предыдущий
+    token = current_deadline.set(new_deadline())
+    try:
+        with accountant.track(message.from_user.id) as usage, profiler.maybe_capture("process_query") as capture:
+            pipeline = Pipeline()
+            try:
+                await _answer_query(message, user_query, extra_context, usage, pipeline)
+            finally:
+                if capture is not None:
+                    capture.stages = dict(pipeline.timings)
+                    capture.meta.update(topic=usage.topic, status=usage.status)
+    finally:
+        current_deadline.reset(token)
+
+async def _answer_query(
+    message: Message,
+    user_query: str,
+    extra_context: str,
+    usage: RequestUsage,
+    pipeline: Pipeline,
+):
+    user_id = message.from_user.id
+
+    async def send_status():
+        return await message.answer("⏳ Принял запрос, начинаю анализ...")
 
-    async def update_status(text):
+    async def update_status(status_msg, text):
         try:
             await status_msg.edit_text(f"⏳ {text}")
         except Exception:
             pass
 
-    try:
-        topic = detect_topic(user_query)
-        
-        law_file = config.LAW_FILES.get(topic, config.LAW_FILES["tax"])
-        law_path = os.path.join(config.DATA_DIR, law_file)
-        law_context = ""
-        
+    async def retrieve():
+        return await asyncio.to_thread(_retrieve_law, user_query)
+
+    async def search(retrieval):
+        topic, has_exact_article, _ = retrieval
+        usage.topic = topic
+        if not needs_web_search(user_query, topic, has_exact_article=has_exact_article):
+            return ""
+        pipeline.stage("status_search", lambda m: update_status(m, random.choice(SEARCH_STATUSES)), ("status",))
+        timeout = stage_timeout(config.SEARCH_STAGE_SECONDS, reserve=search_reserve())
+        if timeout < 1.0:
+            logger.warning("Web search skipped: request time budget is exhausted")
+            return ""
         try:
-            if os.path.exists(law_path):
-                with open(law_path, "r", encoding="utf-8") as f:
-                    law_context = f.read()[:50000]
+            return await asyncio.wait_for(get_tavily_search(user_query), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error("Tavily search timeout")
         except Exception as e:
-            logger.error(f"Error reading law file: {e}")
+            logger.error(f"Tavily search error: {e}")
+        return ""
 
-        web_results = ""
-        if needs_web_search(user_query):
-            logger.info(f"Web search enabled for query: {user_query}")
-            await update_status(random.choice(SEARCH_STATUSES))
-            try:
-                web_results = await asyncio.wait_for(
-                    get_tavily_search(user_query),
-                    timeout=20.0
-                )
-            except asyncio.TimeoutError:
-                logger.error("Tavily search timeout")
-                web_results = ""
-            except Exception as e:
-                logger.error(f"Tavily search error: {e}")
-                web_results = ""
-        else:
-            logger.info("Web search skipped by router.")
-
-        await update_status(random.choice(GENERATING_STATUSES))
-        
-        history = conversation_storage.get_formatted_history(user_id)
-        if extra_context:
-            doc_block = f"Контекст из документа:\n{extra_context}"
-            history = f"{history}\n\n{doc_block}" if history else doc_block
-        elif doc_text_by_user.get(user_id):
-            doc_block = f"Контекст из документа:\n{doc_text_by_user[user_id]}"
-            history = f"{history}\n\n{doc_block}" if history else doc_block
+    async def doc_context():
+        return await asyncio.to_thread(_build_history, user_id, user_query, extra_context)
+
+    # Статус, чтение норм, поиск и подготовка контекста документа не зависят
+    # друг от друга по вводу-выводу и стартуют одновременно
+    pipeline.stage("status", send_status)
+    pipeline.stage("retrieval", retrieve)
+    pipeline.stage("search", search, ("retrieval",))
+    pipeline.stage("doc_context", doc_context)
+
+    status_msg = None
+    try:
+        _, _, law_context = await pipeline.result("retrieval")
+        web_results = await pipeline.result("search")
+        history = await pipeline.result("doc_context")
+        pipeline.stage("status_generating", lambda m: update_status(m, random.choice(GENERATING_STATUSES)), ("status",))
 
         prompt = llm_client.build_prompt(
             user_query=user_query,
@@ -274,37 +510,81 @@ async def process_query(message: Message, user_query: str, extra_context: str =
             history=history,
         )
 
-        try:
-            answer = await asyncio.wait_for(
-                llm_client.generate_response(prompt, image_urls=doc_images_by_user.get(user_id)),
-                timeout=90.0
-            )
-        except asyncio.TimeoutError:
-            answer = "⚠️ Модель не успела ответить вовремя. Попробуйте упростить вопрос."
-        answer = _append_disclaimer(answer)
-        
-        conversation_storage.add_message(user_id, "user", user_query)
-        conversation_storage.add_message(user_id, "assistant", answer)
+        async def generate():
+            # Попытки моделей сами берут таймауты из бюджета; здесь — общий предел
+            timeout = stage_timeout(config.LLM_TIMEOUT_SECONDS, reserve=config.SEND_RESERVE_SECONDS)
+            try:
+                return await asyncio.wait_for(
+                    llm_client.generate_response(prompt, image_urls=doc_images_by_user.get(user_key(user_id))),
+                    timeout=timeout + 1.0,
+                )
+            except asyncio.TimeoutError:
+                record_llm_failure("timeout")
+                return LLM_TIMEOUT_MESSAGE
 
-        try:
-            await status_msg.delete()
-        except Exception:
-            pass
+        answer = _append_disclaimer(await pipeline.stage("llm", generate))
 
-        for part in _split_message(answer):
-            await message.answer(part)
+        conversation_storage.add_message(user_key(user_id), "user", user_query)
+        conversation_storage.add_message(user_key(user_id), "assistant", answer)
+        # Ответ готов и оплачен: новое сообщение его уже не отменяет
+        user_tasks.release(user_key(user_id))
+
+        await pipeline.finish()
+        status_msg = await pipeline.result_or("status")
+        if status_msg:
+            try:
+                await status_msg.delete()
+            except Exception:
+                pass
+
+        async def send():
+            # Ответ модели — HTML: чиним разметку и режем по границам тегов
+            for part in format_html(answer):
+                # Готовый ответ отправляем, даже если бюджет вышел, но не дольше резерва
+                await asyncio.wait_for(message.answer(part), timeout=_send_timeout())
+
+        await pipeline.stage("send", send)
+        deadline = current_deadline.get()
+        budget_left = f" budget_left={deadline.remaining():.1f}s" if deadline else ""
+        logger.info(
+            f"Pipeline timings: {pipeline.report()}{budget_left}",
+            extra={"stages": pipeline.stage_ms(), "total_ms": round(pipeline.elapsed * 1000)},
+        )
+        # Сводку старых реплик строим уже после отправки ответа
+        _run_in_background(_compress_history(user_id))
+
+    except asyncio.CancelledError:
+        # Вопрос отменен новым сообщением или /clear: останавливаем все этапы
+        # (поиск, поток ответа модели) и убираем статус
+        pipeline.cancel()
+        status_msg = status_msg or pipeline.peek("status")
+        if status_msg:
+            try:
+                await asyncio.shield(status_msg.delete())
+            except Exception:
+                pass
+        raise
 
     except Exception as e:
         logger.error(f"Global handler error: {e}")
+        usage.status = "error"
+        if status_msg is None:
+            status_msg = await pipeline.result_or("status")
+        pipeline.cancel()
+        if status_msg:
+            try:
+                await status_msg.delete()
+            except Exception:
+                pass
         try:
-            await status_msg.delete()
-        except Exception:
-            pass
-        await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
+            await asyncio.wait_for(message.answer("⚠️ Произошла ошибка. Попробуйте позже."), timeout=_send_timeout())
+        except Exception as send_error:
+            logger.error(f"Error message not sent: {send_error}")
 
 @router.message(F.photo)
 async def handle_photo(message: Message):
     caption = (message.caption or "").strip()
+    text_context = ""
     image_url = ""
     try:
         photo = message.photo[-1]
@@ -312,12 +592,19 @@ async def handle_photo(message: Message):
         await message.bot.download(photo, destination=buf)
         buf.seek(0)
         data = buf.read()
-        if len(data) <= MAX_DOC_BYTES:
-            image_url = _to_data_url(data, "image/jpeg")
-            _store_user_image(message.from_user.id, image_url)
+        text_context, image_url = await _read_image(message.from_user.id, data, "image/jpeg")
     except Exception as e:
         logger.error(f"Photo download error: {e}")
 
+    if text_context:
+        await _store_document(message.from_user.id, text_context)
+        if caption:
+            await message.answer("Фото получил, текст распознан. Отвечаю по вашему вопросу.")
+            await process_query(message, caption, extra_context=text_context)
+        else:
+            await message.answer("Фото получил, текст распознан. Сформулируйте вопрос по нему — отвечу.")
+        return
+
     if caption:
         if image_url:
             await message.answer("Фото получил. Отвечаю по вашему вопросу.")
@@ -348,7 +635,7 @@ async def handle_document(message: Message):
 
     text_context = ""
     image_url = ""
-    if doc.file_size and doc.file_size > MAX_DOC_BYTES:
+    if doc.file_size and doc.file_size > _max_document_bytes(file_name, mime_type):
         await message.answer(
             "Документ слишком большой для обработки. Пришлите краткий фрагмент или текстовый файл."
         )
@@ -360,7 +647,7 @@ async def handle_document(message: Message):
                 await message.bot.download(doc, destination=buf)
                 buf.seek(0)
                 text_context = buf.read().decode("utf-8", errors="ignore").strip()
-                text_context = _safe_trim(text_context, MAX_DOC_CHARS)
+                text_context = _safe_trim(text_context, MAX_DOC_INDEX_CHARS)
             except Exception as e:
                 logger.error(f"Document download/read error: {e}")
                 text_context = ""
@@ -370,7 +657,7 @@ async def handle_document(message: Message):
                 await message.bot.download(doc, destination=buf)
                 buf.seek(0)
                 text_context = _read_docx_bytes(buf.read())
-                text_context = _safe_trim(text_context, MAX_DOC_CHARS)
+                text_context = _safe_trim(text_context, MAX_DOC_INDEX_CHARS)
             except Exception as e:
                 logger.error(f"DOCX download/read error: {e}")
                 text_context = ""
@@ -380,7 +667,7 @@ async def handle_document(message: Message):
                 await message.bot.download(doc, destination=buf)
                 buf.seek(0)
                 text_context, doc_err = _read_doc_bytes(buf.read())
-                text_context = _safe_trim(text_context, MAX_DOC_CHARS)
+                text_context = _safe_trim(text_context, MAX_DOC_INDEX_CHARS)
                 if not text_context and doc_err == "missing_tool":
                     await message.answer(
                         "DOC получен, но для чтения нужен <code>antiword</code> или <code>catdoc</code>. "
@@ -389,32 +676,36 @@ async def handle_document(message: Message):
             except Exception as e:
                 logger.error(f"DOC download/read error: {e}")
                 text_context = ""
+        elif _is_pdf_file(file_name, mime_type):
+            try:
+                text_context, image_url = await _read_pdf_document(message)
+            except Exception as e:
+                logger.error(f"PDF download/read error: {e}")
+                text_context = ""
         elif _is_image_file(file_name, mime_type):
             try:
                 buf = io.BytesIO()
                 await message.bot.download(doc, destination=buf)
                 buf.seek(0)
                 data = buf.read()
-                if len(data) <= MAX_DOC_BYTES:
-                    image_url = _to_data_url(data, mime_type or "image/jpeg")
-                    _store_user_image(message.from_user.id, image_url)
-                else:
-                    text_context = ""
+                text_context, image_url = await _read_image(
+                    message.from_user.id, data, mime_type or "image/jpeg", as_document=True
+                )
             except Exception as e:
                 logger.error(f"Image document download error: {e}")
                 text_context = ""
         else:
             await message.answer(
-                "Документ получил. Сейчас читаю только текстовые файлы, DOC/DOCX и изображения. "
-                "Если это PDF, пришлите текст или скриншоты страниц."
+                "Документ получил. Сейчас читаю только текстовые файлы, PDF, DOC/DOCX и изображения. "
+                "Пришлите документ в одном из этих форматов или текст."
             )
 
     if caption:
         if text_context:
-            doc_text_by_user[message.from_user.id] = text_context
+            await _store_document(message.from_user.id, text_context)
             await message.answer("Документ получил, отвечаю по вашему вопросу.")
             await process_query(message, caption, extra_context=text_context)
-        elif doc_images_by_user.get(message.from_user.id):
+        elif doc_images_by_user.get(user_key(message.from_user.id)):
             await message.answer("Документ получил. Отвечаю по вашему вопросу.")
             await process_query(message, caption)
         else:
@@ -426,11 +717,11 @@ async def handle_document(message: Message):
         return
 
     if text_context:
-        doc_text_by_user[message.from_user.id] = text_context
+        await _store_document(message.from_user.id, text_context)
         await message.answer(
             "Документ получен. Сформулируйте вопрос по нему — отвечу."
         )
-    elif doc_images_by_user.get(message.from_user.id):
+    elif doc_images_by_user.get(user_key(message.from_user.id)):
         await message.answer(
             "Документ получен. Сформулируйте вопрос — отвечу с учетом изображений."
         )
@@ -445,5 +736,5 @@ async def handle_question(message: Message):
         return
 
     user_id = message.from_user.id
-    extra_context = doc_text_by_user.get(user_id, "")
+    extra_context = doc_text_by_user.get(user_key(user_id), "")
     await process_query(message, message.text, extra_context=extra_context)
@@ -0,0 +1,86 @@
+"""
+Подготовка изображений перед отправкой в модель.
+
+Снимки уменьшаются до IMAGE_MAX_SIDE, сканы документов переводятся
+в оттенки серого с автоконтрастом, а результат перекодируется в
+WebP/JPEG с подбором качества под IMAGE_TARGET_BYTES. Тяжелая часть
+выполняется в пуле процессов (bot/workers.py).
+"""
+import io
+import logging
+
+from bot.config import config
+from bot.workers import run_in_worker
+
+logger = logging.getLogger(__name__)
+
+_QUALITY_STEPS = (85, 75, 65, 55, 45, 35)
+_MIN_SIDE = 512
+# Средняя насыщенность ниже порога — это, скорее всего, фото текста/документа
+_DOCUMENT_SATURATION = 40
+
+
+def _encode(img, fmt: str, target_bytes: int) -> bytes:
+    data = b""
+    for quality in _QUALITY_STEPS:
+        buf = io.BytesIO()
+        if fmt == "WEBP":
+            img.save(buf, format="WEBP", quality=quality, method=4)
+        else:
+            img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+        data = buf.getvalue()
+        if len(data) <= target_bytes:
+            break
+    return data
+
+
+def preprocess_image(
+    data: bytes,
+    as_document: bool,
+    max_side: int,
+    target_bytes: int,
+    fmt: str,
+) -> tuple[bytes, str] | None:
+    """Выполняется в процессе-воркере. Возвращает (байты, mime) или None."""
+    try:
+        from PIL import Image, ImageOps, ImageStat
+    except Exception as e:
+        logger.info(f"Image deps missing: {e}")
+        return None
+
+    fmt = "WEBP" if fmt.upper() == "WEBP" else "JPEG"
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            # Уменьшаем еще на этапе декодирования JPEG — экономит память на больших сканах
+            src.draft("RGB", (max_side, max_side))
+            img = ImageOps.exif_transpose(src)
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+        if not as_document and img.mode == "RGB":
+            saturation = ImageStat.Stat(img.convert("HSV").getchannel("S")).mean[0]
+            as_document = saturation < _DOCUMENT_SATURATION
+        if as_document:
+            img = ImageOps.autocontrast(img.convert("L"), cutoff=1)
+
+        encoded = _encode(img, fmt, target_bytes)
+        while len(encoded) > target_bytes and max(img.size) > _MIN_SIDE:
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+            encoded = _encode(img, fmt, target_bytes)
+    except Exception as e:
+        logger.error(f"Image preprocess error: {e}")
+        return None
+
+    return encoded, f"image/{fmt.lower()}"
+
+
+async def prepare_image(data: bytes, as_document: bool = False) -> tuple[bytes, str] | None:
+    return await run_in_worker(
+        preprocess_image,
+        data,
+        as_document,
+        config.IMAGE_MAX_SIDE,
+        config.IMAGE_TARGET_BYTES,
+        config.IMAGE_FORMAT,
+    )
@@ -0,0 +1,335 @@
+"""
+Офлайн-загрузка больших файлов кодексов (DOCX/TXT/HTML) в data/.
+
+Файлы читаются потоково, кусками, без загрузки целиком в память:
+текст нормализуется (кодировка, пробелы, мягкие переносы), размечаются
+границы разделов, глав, статей и абзацев, а результат пишется в тот же
+формат, что и data/tax_code.txt.
+
+Пример:
+    python -m bot.ingest НК_часть1.docx НК_часть2.html --topic tax
+"""
+import argparse
+import codecs
+import logging
+import os
+import re
+import tempfile
+import time
+import unicodedata
+import zipfile
+from html.parser import HTMLParser
+from typing import Iterable, Iterator
+from xml.etree import ElementTree
+
+from bot.config import config
+from bot.logs import setup_logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # 1 МБ
+SNIFF_SIZE = 64 * 1024
+
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_SPACE_CHARS = {
+    "\u00a0": " ",  # неразрывный пробел
+    "\u2007": " ",
+    "\u2009": " ",
+    "\u202f": " ",
+    "\t": " ",
+    "\u00ad": "",  # мягкий перенос
+    "\u200b": "",
+    "\u200c": "",
+    "\u200d": "",
+    "\ufeff": "",
+}
+_SPACE_TABLE = str.maketrans(_SPACE_CHARS)
+_MULTI_SPACE_RE = re.compile(r" {2,}")
+
+ARTICLE_RE = re.compile(r"^Статья\s+(\d+(?:\.\d+)*(?:-\d+)?)\s*\.?\s*(.*)$", re.IGNORECASE)
+CHAPTER_RE = re.compile(r"^Глава\s+(\d+(?:\.\d+)*)\s*\.?\s*(.*)$", re.IGNORECASE)
+SECTION_RE = re.compile(r"^(Раздел\s+[IVXLC\d]+(?:\.\d+)?|Часть\s+(?:первая|вторая|третья|\d+))\b\.?\s*(.*)$", re.IGNORECASE)
+
+_HTML_BLOCK_TAGS = {
+    "p", "div", "br", "li", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+    "pre", "blockquote", "section", "article", "header", "footer",
+}
+_HTML_SKIP_TAGS = {"script", "style", "head", "title", "noscript"}
+_META_CHARSET_RE = re.compile(rb"charset\s*=\s*[\"']?([A-Za-z0-9_\-]+)", re.IGNORECASE)
+
+
+class IngestStats:
+    def __init__(self):
+        self.bytes_in = 0
+        self.chars_out = 0
+        self.sections = 0
+        self.chapters = 0
+        self.articles = 0
+        self.paragraphs = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.bytes_in / (1024 * 1024) / self.elapsed
+
+    def summary(self) -> str:
+        return (
+            f"{self.bytes_in / (1024 * 1024):.1f} МБ за {self.elapsed:.2f} с "
+            f"({self.mb_per_sec:.1f} МБ/с): разделов {self.sections}, глав {self.chapters}, "
+            f"статей {self.articles}, абзацев {self.paragraphs}"
+        )
+
+
+def _detect_encoding(head: bytes, default: str = "utf-8") -> str:
+    """Определяет кодировку по BOM, meta charset или пробному декодированию."""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    match = _META_CHARSET_RE.search(head)
+    if match:
+        name = match.group(1).decode("ascii", errors="ignore")
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            pass
+    try:
+        # Обрезанный на границе многобайтного символа хвост не считаем ошибкой
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1251" if default == "utf-8" else default
+
+
+def _iter_decoded(path: str, chunk_size: int, stats: IngestStats) -> Iterator[str]:
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_SIZE)
+        encoding = _detect_encoding(head)
+        logger.info(f"{os.path.basename(path)}: кодировка {encoding}")
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        chunk = head
+        while chunk:
+            stats.bytes_in += len(chunk)
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+            chunk = f.read(chunk_size)
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def iter_txt(path: str, chunk_size: int, stats: IngestStats) -> Iterator[str]:
+    yield from _iter_decoded(path, chunk_size, stats)
+
+
+class _HTMLTextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: list[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HTML_SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _HTML_BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _HTML_SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _HTML_BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data.replace("\n", " "))
+
+    def drain(self) -> str:
+        text = "".join(self.parts)
+        self.parts.clear()
+        return text
+
+
+def iter_html(path: str, chunk_size: int, stats: IngestStats) -> Iterator[str]:
+    parser = _HTMLTextExtractor()
+    for text in _iter_decoded(path, chunk_size, stats):
+        parser.feed(text)
+        out = parser.drain()
+        if out:
+            yield out
+    parser.close()
+    out = parser.drain()
+    if out:
+        yield out
+
+
+class _CountingReader:
+    """Обертка над файлом из архива для подсчета прочитанных байт."""
+
+    def __init__(self, raw, stats: IngestStats):
+        self._raw = raw
+        self._stats = stats
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self._stats.bytes_in += len(data)
+        return data
+
+
+def iter_docx(path: str, chunk_size: int, stats: IngestStats) -> Iterator[str]:
+    """Потоково читает word/document.xml, не строя полное дерево документа."""
+    with zipfile.ZipFile(path) as zf:
+        with zf.open("word/document.xml") as raw:
+            parser = ElementTree.XMLPullParser(events=("start", "end"))
+            reader = _CountingReader(raw, stats)
+            body = None
+            buf: list[str] = []
+            while True:
+                data = reader.read(chunk_size)
+                if not data:
+                    break
+                parser.feed(data)
+                for event, elem in parser.read_events():
+                    if event == "start":
+                        if elem.tag == f"{_W_NS}body":
+                            body = elem
+                        continue
+                    if elem.tag == f"{_W_NS}t" and elem.text:
+                        buf.append(elem.text)
+                    elif elem.tag in (f"{_W_NS}tab", f"{_W_NS}br"):
+                        buf.append(" ")
+                    elif elem.tag == f"{_W_NS}p":
+                        buf.append("\n")
+                        elem.clear()
+                        # Отцепляем обработанные абзацы верхнего уровня, чтобы
+                        # дерево не росло вместе с документом
+                        if body is not None and len(body) and body[-1] is elem:
+                            body.remove(elem)
+                    elif body is not None and elem.tag == f"{_W_NS}tbl":
+                        elem.clear()
+                        if len(body) and body[-1] is elem:
+                            body.remove(elem)
+                if buf:
+                    yield "".join(buf)
+                    buf.clear()
+            parser.close()
+
+
+READERS = {
+    ".txt": iter_txt,
+    ".htm": iter_html,
+    ".html": iter_html,
+    ".docx": iter_docx,
+}
+
+
+def normalize_line(line: str) -> str:
+    line = unicodedata.normalize("NFC", line).translate(_SPACE_TABLE)
+    return _MULTI_SPACE_RE.sub(" ", line).strip()
+
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Склеивает куски в строки; неполная последняя строка ждет следующего куска."""
+    carry = ""
+    for chunk in chunks:
+        chunk = carry + chunk.replace("\r\n", "\n").replace("\r", "\n")
+        lines = chunk.split("\n")
+        carry = lines.pop()
+        for line in lines:
+            yield line
+    if carry:
+        yield carry
+
+
+def iter_blocks(lines: Iterable[str], stats: IngestStats) -> Iterator[str]:
+    """Размечает структуру: заголовки и абзацы отделяются пустой строкой."""
+    for raw in lines:
+        line = normalize_line(raw)
+        if not line:
+            continue
+        match = ARTICLE_RE.match(line)
+        if match:
+            stats.articles += 1
+            title = match.group(2).strip()
+            yield f"Статья {match.group(1)}. {title}".rstrip()
+            continue
+        match = CHAPTER_RE.match(line)
+        if match:
+            stats.chapters += 1
+            title = match.group(2).strip()
+            yield f"Глава {match.group(1)}. {title}".rstrip()
+            continue
+        if SECTION_RE.match(line):
+            stats.sections += 1
+            yield line
+            continue
+        stats.paragraphs += 1
+        yield line
+
+
+def _reader_for(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    reader = READERS.get(ext)
+    if reader is None:
+        raise ValueError(f"Неподдерживаемый формат: {path} (ожидается {', '.join(sorted(READERS))})")
+    return reader
+
+
+def ingest(sources: list[str], output_path: str, title: str = "", chunk_size: int = CHUNK_SIZE) -> IngestStats:
+    """Нормализует источники и атомарно записывает корпус в output_path."""
+    stats = IngestStats()
+    readers = [(src, _reader_for(src)) for src in sources]
+    out_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".ingest-", suffix=".txt", dir=out_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as out:
+            if title:
+                out.write(f"{title.strip()}\n\n")
+            for src, reader in readers:
+                logger.info(f"Загрузка {src}")
+                chunks = reader(src, chunk_size, stats)
+                for block in iter_blocks(iter_lines(chunks), stats):
+                    out.write(block)
+                    out.write("\n\n")
+                    stats.chars_out += len(block) + 2
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Загрузка кодексов в data/ для бота")
+    parser.add_argument("sources", nargs="+", help="файлы DOCX/TXT/HTML (по порядку частей кодекса)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--topic", choices=sorted(config.LAW_FILES), help="записать в файл темы из Config.LAW_FILES")
+    target.add_argument("--output", help="путь к выходному файлу")
+    parser.add_argument("--title", default="", help="заголовок корпуса (первая строка)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="размер куска чтения в байтах")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    output_path = args.output or os.path.join(config.DATA_DIR, config.LAW_FILES[args.topic])
+    try:
+        stats = ingest(args.sources, output_path, title=args.title, chunk_size=args.chunk_size)
+    except (OSError, ValueError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+        logger.error(f"Ошибка загрузки: {e}")
+        return 1
+    logger.info(f"Готово: {output_path}")
+    logger.info(stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+"""
+Запуск и остановка общих ресурсов бота (для main.py и main_webhook.py).
+
+Глобальные клиенты создаются здесь, а не при импорте модулей. В режиме
+STARTUP_LAZY тяжелый прогрев (индекс статей, словарь опечаток, индекс
+покрытия, FAQ, импорт openai/httpx и клиент OpenRouter) уходит в фон после
+того, как бот начал принимать апдейты; если апдейт придет раньше, клиент
+создастся при первом обращении.
+"""
+import asyncio
+import logging
+import time
+
+from bot.accounting import accountant
+from bot.articles import article_index
+from bot.config import config
+from bot.faq import faq_store
+from bot.llm import llm_client
+from bot.query_norm import query_normalizer
+from bot.search import tavily_search
+from bot.search_gate import corpus_coverage
+from bot.workers import shutdown_workers
+
+logger = logging.getLogger(__name__)
+
+_warmup_task: asyncio.Task | None = None
+
+
+async def warm_up():
+    started = time.perf_counter()
+    await asyncio.to_thread(article_index.warm_up)
+    await asyncio.to_thread(query_normalizer.warm_up)
+    # Индекс покрытия строится после словаря опечаток: термины корпуса идут через нормализатор
+    await asyncio.to_thread(corpus_coverage.warm_up)
+    if config.FAQ_ENABLED:
+        await asyncio.to_thread(faq_store.load)
+    await asyncio.to_thread(llm_client.init)
+    logger.info(f"Warm-up done in {time.perf_counter() - started:.2f}s")
+
+
+async def startup(lazy: bool | None = None):
+    global _warmup_task
+    await accountant.start()
+    await tavily_search.start()
+    if config.STARTUP_LAZY if lazy is None else lazy:
+        _warmup_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+
+
+async def shutdown():
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
+    await accountant.stop()
+    await tavily_search.close()
+    await llm_client.close()
+    shutdown_workers()
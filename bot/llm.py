@@ -1,33 +1,70 @@
-import httpx
+import asyncio
 import logging
-from openai import AsyncOpenAI
+import threading
+from typing import TYPE_CHECKING
+
+from bot.accounting import record_llm_cancelled, record_llm_failure, record_llm_usage
 from bot.config import config
+from bot.deadline import stage_timeout
+from bot.storage import extractive_summary
+from bot.tasks import cancel_reason
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
+LLM_TIMEOUT_MESSAGE = "⚠️ Модель не успела ответить вовремя. Попробуйте упростить вопрос."
+
 class LLMClient:
     def __init__(self):
-        if config.OPENROUTER_API_KEY:
-            # ✅ ВАЖНОЕ ИСПРАВЛЕНИЕ: Добавляем таймауты
-            # connect: время на соединение с сервером
-            # read: сколько ждем генерацию ответа (ставим 90 сек, чтобы Llama успела подумать)
-            timeout = httpx.Timeout(
-                connect=10.0,
-                read=90.0, 
-                write=10.0,
-                pool=10.0,
-            )
-            
-            # Передаем timeout в клиент
-            http_client = httpx.AsyncClient(timeout=timeout)
-
-            self.client = AsyncOpenAI(
-                api_key=config.OPENROUTER_API_KEY,
-                base_url=config.OPENROUTER_BASE_URL,
-                http_client=http_client,
-            )
-        else:
-            self.client = None
+        # openai/httpx импортируются при первом обращении или в startup-хуке,
+        # а не при импорте модуля — это заметная часть холодного старта
+        self._client: "AsyncOpenAI | None" = None
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def init(self):
+        """Создает HTTP-клиент OpenRouter (идемпотентно, можно вызывать из потока)."""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            if config.OPENROUTER_API_KEY:
+                import httpx
+                from openai import AsyncOpenAI
+
+                # ✅ ВАЖНОЕ ИСПРАВЛЕНИЕ: Добавляем таймауты
+                # connect: время на соединение с сервером
+                # read: сколько ждем генерацию ответа (LLM_TIMEOUT_SECONDS; на запрос — меньше, по бюджету)
+                timeout = httpx.Timeout(
+                    connect=10.0,
+                    read=config.LLM_TIMEOUT_SECONDS,
+                    write=10.0,
+                    pool=10.0,
+                )
+
+                # Передаем timeout в клиент
+                http_client = httpx.AsyncClient(timeout=timeout)
+
+                self._client = AsyncOpenAI(
+                    api_key=config.OPENROUTER_API_KEY,
+                    base_url=config.OPENROUTER_BASE_URL,
+                    http_client=http_client,
+                )
+            self._initialized = True
+
+    @property
+    def client(self) -> "AsyncOpenAI | None":
+        self.init()
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._initialized = False
 
     # 👇 ЭТОТ МЕТОД ОСТАВЛЯЕМ КАК БЫЛ У ВАС (он правильный)
     def build_prompt(self, user_query: str, law_context: str, web_results: str, history: str) -> str:
@@ -91,6 +128,7 @@ class LLMClient:
     async def generate_response(self, prompt: str, image_urls: list[str] | None = None) -> str:
         """Генерация ответа через OpenRouter"""
         if not self.client:
+            record_llm_failure("error")
             return "❌ Ошибка: API ключ OpenRouter не найден."
 
         try:
@@ -99,13 +137,30 @@ class LLMClient:
                 for url in image_urls:
                     content.append({"type": "image_url", "image_url": {"url": url}})
 
-            async def _call(model_name: str):
-                return await self.client.chat.completions.create(
+            async def _call(model_name: str, timeout: float, parts: list[str]) -> str:
+                # Ответ читается потоком: при отмене запроса поток закрывается,
+                # соединение освобождается и генерация (и оплата) токенов прекращается
+                stream = await self.client.chat.completions.create(
                     model=model_name,
                     messages=[{"role": "user", "content": content}],
                     temperature=0.3,
                     max_tokens=2000,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    # Срабатывает asyncio.wait_for снаружи; HTTP-таймаут — страховка
+                    timeout=timeout + 1.0,
                 )
+                usage = None
+                try:
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                finally:
+                    await stream.close()
+                record_llm_usage(model_name, usage)
+                return "".join(parts)
 
             models = [config.MODEL_NAME]
             for m in config.MODEL_FALLBACKS:
@@ -114,17 +169,64 @@ class LLMClient:
 
             last_err: Exception | None = None
             for idx, model_name in enumerate(models):
+                # Каждая попытка получает остаток бюджета запроса за вычетом резерва на отправку
+                timeout = stage_timeout(config.LLM_TIMEOUT_SECONDS, reserve=config.SEND_RESERVE_SECONDS)
+                if timeout < (config.LLM_FALLBACK_MIN_SECONDS if idx else 1.0):
+                    logger.warning(f"No time budget left for model {model_name} ({timeout:.1f}s)")
+                    last_err = last_err or asyncio.TimeoutError()
+                    break
+                parts: list[str] = []
                 try:
-                    response = await _call(model_name)
-                    return response.choices[0].message.content
+                    return await asyncio.wait_for(_call(model_name, timeout, parts), timeout=timeout)
+                except asyncio.CancelledError:
+                    # Таймауты приходят сюда как TimeoutError; отмену пользователем
+                    # (новое сообщение, /clear) учитываем как сэкономленные токены
+                    if cancel_reason():
+                        record_llm_cancelled(model_name, sum(map(len, parts)))
+                    raise
                 except Exception as e:
                     last_err = e
                     if idx < len(models) - 1:
-                        logger.warning(f"Model failed, trying fallback: {models[idx + 1]}. Error: {e}")
+                        logger.warning(f"Model failed, trying fallback: {models[idx + 1]}. Error: {e!r}")
 
+            # Текст ошибки уходит пользователю как ответ; статус запроса отличает его от ответа модели
+            if isinstance(last_err, asyncio.TimeoutError):
+                record_llm_failure("timeout")
+                return LLM_TIMEOUT_MESSAGE
+            record_llm_failure("error")
             return f"⚠️ Ошибка генерации: {str(last_err)}"
         except Exception as e:
+            record_llm_failure("error")
             return f"⚠️ Ошибка генерации: {str(e)}"
 
+    async def summarize_history(self, summary: str, turns: list[dict], max_chars: int) -> str:
+        """Сжатие старых реплик дешевой моделью; без нее или при ошибке — извлечением"""
+        if not self.client or not config.HISTORY_SUMMARY_MODEL:
+            return await extractive_summary(summary, turns, max_chars)
+
+        dialog = "\n".join(
+            f"{'Пользователь' if m['role'] == 'user' else 'Ассистент'}: {m['content']}" for m in turns
+        )
+        prompt = (
+            f"Обнови краткое содержание диалога налогового консультанта с клиентом. "
+            f"Сохрани факты о клиенте (режим налогообложения, статус, суммы, сроки) и выводы. "
+            f"Не длиннее {max_chars} символов, без вступлений.\n\n"
+            f"Текущее содержание:\n{summary or '(пусто)'}\n\nНовые реплики:\n{dialog}"
+        )
+        try:
+            response = await self.client.chat.completions.create(
+                model=config.HISTORY_SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                max_tokens=max(100, max_chars // 2),
+            )
+            record_llm_usage(config.HISTORY_SUMMARY_MODEL, getattr(response, "usage", None))
+            text = (response.choices[0].message.content or "").strip()
+            if text:
+                return text[:max_chars]
+        except Exception as e:
+            logger.warning(f"History summary model failed, using extractive summary. Error: {e}")
+        return await extractive_summary(summary, turns, max_chars)
+
 # Создаем глобальный объект
 llm_client = LLMClient()
@@ -0,0 +1,199 @@
+"""
+Логирование: настраивается один раз при старте (setup_logging).
+
+Записи не пишутся в stdout из event loop: обработчик корня кладет их в
+очередь (QueueHandler), а печатает отдельный поток (QueueListener). Если
+stdout не успевает, очередь ограничена и лишние записи отбрасываются с
+подсчетом, а не тормозят ответы. Формат — JSON на строку с id запроса,
+ботом и структурированными полями из extra (например, тайминги этапов);
+LOG_FORMAT=text — привычный текст для локального запуска. Процессы пула
+(bot/workers.py) пишут в stdout напрямую: event loop в них нет.
+
+Частые отладочные события (попадания в кэш, улучшенные запросы) пишутся
+на DEBUG и сэмплируются долей LOG_DEBUG_SAMPLE_RATE; решение о веб-поиске
+пишется на INFO по каждому запросу с полями search/coverage/reasons.
+Текст пользователя в логи попадает только через redact(): по умолчанию
+вместо него — длина и короткий хэш (одинаковые вопросы видно, содержимое —
+нет).
+"""
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import random
+import signal
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import TextIO
+
+from bot.config import bot_name, config
+
+# Id обрабатываемого апдейта или вопроса пакетного режима
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Стандартные поля LogRecord; остальное пришло через extra и попадает в JSON
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "bot"}
+
+_listener: QueueListener | None = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class Redacted:
+    """Текст пользователя в логе; скрывается только при форматировании записи."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __str__(self) -> str:
+        if config.LOG_REDACT == "none":
+            return self.text
+        digest = hashlib.blake2s(self.text.encode("utf-8"), digest_size=5).hexdigest()
+        return f"<{len(self.text)} chars #{digest}>"
+
+    __repr__ = __str__
+
+
+def redact(text: str) -> Redacted:
+    return Redacted(text)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи id запроса и бота (contextvars читаются в потоке вызова)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.bot = bot_name()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю DEBUG-записей."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись, а не ждет."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и трейсбек собираются здесь: аргументы могут измениться позже
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "bot": getattr(record, "bot", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _text_formatter() -> logging.Formatter:
+    return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s %(bot)s] %(message)s")
+
+
+def _output_handler(stream: TextIO) -> logging.Handler:
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else _text_formatter())
+    return output
+
+
+def _replace_root_handler(handler: logging.Handler):
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL.upper())
+
+
+def _exit_on_sigterm(signum, frame):
+    # По умолчанию SIGTERM завершает процесс без atexit, и очередь логов не дописывается
+    raise SystemExit(128 + signum)
+
+
+def setup_logging(stream: TextIO | None = None):
+    """Настраивает корневой логгер (повторные вызовы ничего не делают); по умолчанию пишет в stdout."""
+    global _listener
+    if _listener is not None:
+        return
+    output = _output_handler(stream or sys.stdout)
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter(config.LOG_DEBUG_SAMPLE_RATE))
+    handler.addFilter(ContextFilter())
+    _replace_root_handler(handler)
+
+    _listener = QueueListener(handler.queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+
+def setup_worker_logging():
+    """
+    Инициализатор процесса пула: унаследованный при fork QueueHandler пишет
+    в очередь, которую в дочернем процессе никто не читает, поэтому здесь
+    записи уходят в stdout напрямую, в том же формате.
+    """
+    global _listener
+    # Поток записи родителя в дочерний процесс не копируется
+    _listener = None
+    handler = _output_handler(sys.stdout)
+    handler.addFilter(SamplingFilter(config.LOG_DEBUG_SAMPLE_RATE))
+    handler.addFilter(ContextFilter())
+    _replace_root_handler(handler)
+
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает поток записи."""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+            if handler.dropped:
+                sys.stderr.write(f"logging: {handler.dropped} records dropped (queue full)\n")
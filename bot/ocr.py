@@ -0,0 +1,118 @@
+"""
+Локальное распознавание текста на фото и сканах (Tesseract, только CPU).
+
+Распознанный текст идет тем же путем, что и текст DOCX (doc_text_by_user),
+а изображение отправляется в модель только при низкой уверенности OCR.
+Запуск tesseract выполняется в пуле процессов (bot/workers.py).
+"""
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import NamedTuple
+
+from bot.config import config
+from bot.workers import run_in_worker
+
+logger = logging.getLogger(__name__)
+
+
+class OCRResult(NamedTuple):
+    text: str
+    confidence: float
+    error: str | None = None
+
+
+def _prepare_for_ocr(data: bytes) -> bytes:
+    """Оттенки серого и автоконтраст заметно повышают качество Tesseract на фото."""
+    try:
+        from PIL import Image, ImageOps
+    except Exception:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            img = ImageOps.exif_transpose(src)
+            img = ImageOps.autocontrast(img.convert("L"), cutoff=1)
+            # Мелкий текст на небольших фото распознается лучше после увеличения
+            if max(img.size) < 1500:
+                scale = 1500 / max(img.size)
+                img = img.resize((int(img.width * scale), int(img.height * scale)), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="PNG")
+            return buf.getvalue()
+    except Exception as e:
+        logger.error(f"OCR preprocess error: {e}")
+        return data
+
+
+def _parse_tsv(tsv: str) -> OCRResult:
+    lines: dict[tuple[str, str, str, str], list[str]] = {}
+    weighted = 0.0
+    total_chars = 0
+    for row in tsv.splitlines()[1:]:
+        cols = row.split("\t")
+        if len(cols) < 12:
+            continue
+        word = cols[11].strip()
+        try:
+            conf = float(cols[10])
+        except ValueError:
+            continue
+        if not word or conf < 0:
+            continue
+        key = (cols[1], cols[2], cols[3], cols[4])  # страница, блок, абзац, строка
+        lines.setdefault(key, []).append(word)
+        weighted += conf * len(word)
+        total_chars += len(word)
+
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = weighted / total_chars if total_chars else 0.0
+    return OCRResult(text=text.strip(), confidence=confidence)
+
+
+def ocr_image(data: bytes, lang: str, timeout: float) -> OCRResult:
+    """Выполняется в процессе-воркере."""
+    tool = shutil.which("tesseract")
+    if not tool:
+        return OCRResult("", 0.0, "missing_tool")
+
+    tmp_path = ""
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+            tmp.write(_prepare_for_ocr(data))
+            tmp_path = tmp.name
+        res = subprocess.run(
+            [tool, tmp_path, "stdout", "-l", lang, "--psm", "3", "tsv"],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        if res.returncode != 0:
+            logger.error(f"OCR error: {res.stderr.strip()[:200]}")
+            return OCRResult("", 0.0, "parse_error")
+        return _parse_tsv(res.stdout or "")
+    except subprocess.TimeoutExpired:
+        return OCRResult("", 0.0, "timeout")
+    except Exception as e:
+        logger.error(f"OCR error: {e}")
+        return OCRResult("", 0.0, "parse_error")
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
+
+
+def is_confident(result: OCRResult) -> bool:
+    return (
+        not result.error
+        and result.confidence >= config.OCR_MIN_CONFIDENCE
+        and len(result.text) >= config.OCR_MIN_CHARS
+    )
+
+
+async def extract_text(data: bytes) -> OCRResult:
+    return await run_in_worker(ocr_image, data, config.OCR_LANG, config.OCR_TIMEOUT)
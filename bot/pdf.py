@@ -0,0 +1,107 @@
+"""
+Извлечение текста из PDF постранично, без рендеринга всего документа.
+
+Страницы читаются по одной (pypdf), чтение останавливается, как только
+набрано max_chars символов. Если текстового слоя нет (скан), первые
+страницы растеризуются через pdftoppm и дальше идут как изображения
+(OCR или vision). Работа выполняется в пуле процессов (bot/workers.py).
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import NamedTuple
+
+from bot.config import config
+from bot.workers import run_in_worker
+
+logger = logging.getLogger(__name__)
+
+
+class PDFResult(NamedTuple):
+    text: str
+    pages_read: int
+    total_pages: int
+    page_images: list[bytes]
+    error: str | None = None
+
+
+def _rasterize(path: str, pages: int, dpi: int, timeout: float) -> tuple[list[bytes], str | None]:
+    tool = shutil.which("pdftoppm")
+    if not tool:
+        return [], "missing_tool"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prefix = os.path.join(tmp_dir, "page")
+        try:
+            res = subprocess.run(
+                [tool, "-f", "1", "-l", str(pages), "-r", str(dpi), "-gray", "-png", path, prefix],
+                capture_output=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return [], "timeout"
+        if res.returncode != 0:
+            return [], "parse_error"
+        images: list[bytes] = []
+        for name in sorted(os.listdir(tmp_dir)):
+            with open(os.path.join(tmp_dir, name), "rb") as f:
+                images.append(f.read())
+        return images, None
+
+
+def extract_pdf(path: str, max_chars: int, raster_pages: int, dpi: int, min_text_chars: int) -> PDFResult:
+    """Выполняется в процессе-воркере; path — временный файл с PDF."""
+    try:
+        from pypdf import PdfReader
+    except Exception as e:
+        logger.info(f"PDF deps missing: {e}")
+        return PDFResult("", 0, 0, [], "missing_deps")
+
+    parts: list[str] = []
+    collected = 0
+    pages_read = 0
+    try:
+        reader = PdfReader(path)
+        if reader.is_encrypted:
+            try:
+                reader.decrypt("")
+            except Exception:
+                return PDFResult("", 0, 0, [], "encrypted")
+        total_pages = len(reader.pages)
+        for idx in range(total_pages):
+            try:
+                page_text = (reader.pages[idx].extract_text() or "").strip()
+            except Exception as e:
+                logger.warning(f"PDF page {idx + 1} extract error: {e}")
+                page_text = ""
+            pages_read += 1
+            if page_text:
+                parts.append(page_text)
+                collected += len(page_text)
+            if collected >= max_chars:
+                break
+            # Несколько первых страниц без текста — считаем документ сканом
+            if pages_read >= raster_pages and collected < min_text_chars:
+                break
+    except Exception as e:
+        logger.error(f"PDF parse error: {e}")
+        return PDFResult("", pages_read, 0, [], "parse_error")
+
+    text = "\n\n".join(parts).strip()
+    if len(text) >= min_text_chars or (text and pages_read == total_pages):
+        return PDFResult(text[:max_chars], pages_read, total_pages, [])
+
+    images, err = _rasterize(path, min(raster_pages, total_pages) or 1, dpi, timeout=60)
+    return PDFResult(text, pages_read, total_pages, images, err)
+
+
+async def read_pdf(path: str, max_chars: int) -> PDFResult:
+    return await run_in_worker(
+        extract_pdf,
+        path,
+        max_chars,
+        config.PDF_RASTER_PAGES,
+        config.PDF_RASTER_DPI,
+        config.PDF_MIN_TEXT_CHARS,
+    )
@@ -0,0 +1,85 @@
+"""
+Небольшой асинхронный граф этапов обработки запроса.
+
+Каждый этап запускается задачей сразу, как только готовы его входы
+(результаты этапов-зависимостей), а время начала и длительность этапов
+записываются — так видно, что выполняется параллельно, а что ждет.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    def __init__(self, name: str = "query"):
+        self.name = name
+        self.started = time.perf_counter()
+        # этап -> (смещение начала от старта, длительность), в секундах
+        self.timings: dict[str, tuple[float, float]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def stage(self, name: str, fn: Callable[..., Awaitable[Any]], deps: tuple[str, ...] = ()) -> asyncio.Task:
+        """Регистрирует этап; fn вызывается с результатами deps в том же порядке."""
+        for dep in deps:
+            if dep not in self._tasks:
+                raise KeyError(f"Unknown dependency '{dep}' for stage '{name}'")
+
+        async def run():
+            args = [await self._tasks[dep] for dep in deps]
+            start = time.perf_counter()
+            try:
+                return await fn(*args)
+            finally:
+                end = time.perf_counter()
+                self.timings[name] = (start - self.started, end - start)
+
+        task = asyncio.create_task(run(), name=f"{self.name}:{name}")
+        self._tasks[name] = task
+        return task
+
+    async def result(self, name: str) -> Any:
+        return await self._tasks[name]
+
+    async def result_or(self, name: str, default: Any = None) -> Any:
+        """Результат этапа или default, если этап упал (ошибка пишется в лог)."""
+        try:
+            return await self._tasks[name]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stage '{name}' failed: {e}")
+            return default
+
+    def peek(self, name: str, default: Any = None) -> Any:
+        """Результат этапа, если он уже успешно завершился, иначе default (без ожидания)."""
+        task = self._tasks.get(name)
+        if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+            return default
+        return task.result()
+
+    async def finish(self):
+        """Дожидается фоновых этапов (например, обновления статуса)."""
+        pending = [t for t in self._tasks.values() if not t.done()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def cancel(self):
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def stage_ms(self) -> dict[str, list[int]]:
+        """Этапы для структурированного лога: [начало, длительность] в миллисекундах."""
+        return {name: [round(start * 1000), round(dur * 1000)] for name, (start, dur) in self.timings.items()}
+
+    def report(self) -> str:
+        stages = sorted(self.timings.items(), key=lambda kv: kv[1][0])
+        parts = [f"{name}@{start * 1000:.0f}ms+{dur * 1000:.0f}ms" for name, (start, dur) in stages]
+        return f"total={self.elapsed * 1000:.0f}ms " + " ".join(parts)
@@ -0,0 +1,182 @@
+"""
+Профилирование по запросу и выборочно (PROFILE_ENABLED + PROFILE_SAMPLE_RATE).
+
+Для выбранного вызова process_query снимается:
+  *.prof   — cProfile/pstats (snakeviz, flameprof, gprof2dot);
+  *.folded — свернутые стеки сэмплирующего профайлера (flamegraph.pl, speedscope, inferno);
+  *.json   — тайминги асинхронных этапов пайплайна и метаданные.
+Файлы пишутся в PROFILE_DIR, хранятся последние PROFILE_KEEP снимков.
+
+cProfile и сэмплер видят весь поток event loop, поэтому в снимок попадают
+и другие запросы, выполнявшиеся одновременно; одновременно идет только один снимок.
+"""
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+from bot.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler(threading.Thread):
+    """Раз в interval секунд снимает стек целевого потока (по умолчанию — потока event loop)."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names: list[str] = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join(timeout=1.0)
+        return self.stacks
+
+
+class Capture:
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.time()
+        # Этапы пайплайна: имя -> (смещение начала, длительность)
+        self.stages: dict[str, tuple[float, float]] = {}
+        self.meta: dict[str, object] = {}
+
+
+class Profiler:
+    def __init__(self):
+        self._forced = 0
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def request_captures(self, count: int):
+        """Принудительно профилировать следующие count запросов (без рестарта)."""
+        with self._lock:
+            self._forced += max(0, count)
+
+    def _should_profile(self) -> bool:
+        with self._lock:
+            if self._forced > 0:
+                self._forced -= 1
+                return True
+        return config.PROFILE_ENABLED and random.random() < config.PROFILE_SAMPLE_RATE
+
+    @contextmanager
+    def _profiled(self, label: str) -> Iterator[Capture | None]:
+        # Профилировщик в потоке один: если снимок уже идет, этот вызов пропускаем
+        if not self._active.acquire(blocking=False):
+            yield None
+            return
+        capture = Capture(label)
+        profile = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), config.PROFILE_SAMPLER_INTERVAL)
+        try:
+            sampler.start()
+            profile.enable()
+            try:
+                yield capture
+            finally:
+                profile.disable()
+                stacks = sampler.stop()
+                try:
+                    self._write(capture, profile, stacks)
+                except Exception as e:
+                    logger.error(f"Profile write error: {e}")
+        finally:
+            self._active.release()
+
+    @contextmanager
+    def maybe_capture(self, label: str) -> Iterator[Capture | None]:
+        """Профилирует блок, если вызов попал в выборку; иначе отдает None."""
+        if not self._should_profile():
+            yield None
+            return
+        with self._profiled(label) as capture:
+            yield capture
+
+    async def capture_window(self, seconds: float) -> list[str]:
+        """Снимок всего event loop за окно в seconds секунд."""
+        with self._profiled("window") as capture:
+            if capture is None:
+                return []
+            capture.meta["seconds"] = seconds
+            await asyncio.sleep(seconds)
+        return capture.meta.get("files", [])
+
+    def _write(self, capture: Capture, profile: cProfile.Profile, stacks: Counter):
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(capture.started))
+        millis = int(capture.started * 1000) % 1000
+        base = os.path.join(config.PROFILE_DIR, f"{stamp}-{millis:03d}-{capture.label}")
+
+        profile.dump_stats(f"{base}.prof")
+        with open(f"{base}.folded", "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        files = [f"{base}.prof", f"{base}.folded", f"{base}.json"]
+        capture.meta["files"] = files
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "label": capture.label,
+                    "started": capture.started,
+                    "duration": time.time() - capture.started,
+                    "samples": sum(stacks.values()),
+                    "stages": {
+                        name: {"start_ms": round(start * 1000, 1), "duration_ms": round(dur * 1000, 1)}
+                        for name, (start, dur) in capture.stages.items()
+                    },
+                    "meta": {k: v for k, v in capture.meta.items() if k != "files"},
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        logger.info(f"Profile written: {base}.*")
+        self._rotate()
+
+    def _rotate(self):
+        try:
+            names = [n for n in os.listdir(config.PROFILE_DIR) if n.endswith(".json")]
+        except OSError:
+            return
+        names.sort()
+        excess = len(names) - config.PROFILE_KEEP
+        for name in names[:max(0, excess)]:
+            base = os.path.join(config.PROFILE_DIR, name[:-len(".json")])
+            for ext in (".prof", ".folded", ".json"):
+                try:
+                    os.unlink(base + ext)
+                except OSError:
+                    pass
+
+    def list_captures(self) -> list[str]:
+        try:
+            return sorted(n[:-len(".json")] for n in os.listdir(config.PROFILE_DIR) if n.endswith(".json"))
+        except OSError:
+            return []
+
+
+profiler = Profiler()
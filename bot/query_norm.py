@@ -0,0 +1,340 @@
+"""
+Нормализация вопросов для маршрутизации, ключей кэша и поиска.
+
+Текст приводится к нижнему регистру, ё → е, пунктуация убирается,
+окончания после аббревиатур отбрасываются («НДФЛ-ом» → «ндфл»), опечатки
+исправляются по словарю удалений в духе SymSpell, а синонимы и полные
+названия сводятся к аббревиатурам («упрощенка» → «усн»). Термины для
+индексов — слова после легкого стемминга русских окончаний.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+from bot.articles import article_index
+from bot.config import config
+
+logger = logging.getLogger(__name__)
+
+# Аббревиатуры не стеммятся и не исправляются
+ABBREVIATIONS = {
+    "ип", "ооо", "ао", "пао", "нко", "усн", "осно", "енвд", "псн", "нпд", "есхн", "ндфл", "ндс",
+    "ндпи", "нк", "коап", "гк", "тк", "рф", "фнс", "ифнс", "цб", "вэд", "фз", "кбк", "оквэд", "инн",
+}
+
+# Полные названия и разговорные варианты → аббревиатура
+SYNONYMS = {
+    "индивидуальный предприниматель": "ип",
+    "общество с ограниченной ответственностью": "ооо",
+    "упрощенная система налогообложения": "усн",
+    "упрощенная система": "усн",
+    "упрощенка": "усн",
+    "общая система налогообложения": "осно",
+    "общий режим налогообложения": "осно",
+    "патентная система налогообложения": "псн",
+    "налог на профессиональный доход": "нпд",
+    "налог на доходы физических лиц": "ндфл",
+    "подоходный налог": "ндфл",
+    "налог на добавленную стоимость": "ндс",
+    "налоговый кодекс": "нк",
+    "кодекс об административных правонарушениях": "коап",
+    "федеральная налоговая служба": "фнс",
+    "внешнеэкономическая деятельность": "вэд",
+    "центральный банк": "цб",
+    "центробанк": "цб",
+    "банк россии": "цб",
+}
+
+STOPWORDS = {
+    "что", "как", "какой", "какая", "какие", "ли", "мне", "мой", "моя", "мои", "это", "или",
+    "для", "при", "если", "надо", "нужно", "можно", "есть", "был", "была", "будет", "мы",
+    "они", "она", "оно", "его", "ее", "их", "по", "на", "в", "во", "с", "со", "и", "а", "но",
+    "не", "же", "у", "от", "до", "за", "из", "к", "ко", "о", "об", "про", "так", "все", "уже",
+    "когда", "где", "кто", "чем", "том", "этом", "этого", "какую", "каком", "рф",
+}
+
+# Частые слова предметной области: известны и без корпуса из data/
+LEXICON = """
+налог налоги налога налогов налоговая налоговый налоговой налоговые налогообложение налогообложения
+налогоплательщик налогоплательщика вычет вычета вычеты декларация декларацию декларации отчетность
+отчет отчета доход доходы дохода расход расходы прибыль прибыли убыток имущество имущества
+недвижимость недвижимости квартира квартиры продажа продажи продаже покупка дарение наследство
+доля доли долю участник участника участие уставный капитал дивиденды дивидендов организация
+организации компания компании предприниматель предпринимателя самозанятый самозанятые патент
+зарплата заработная работник работодатель страховые взносы взносов льгота льготы освобождение
+ставка ставки штраф штрафа штрафы пени ответственность административный административная
+правонарушение нарушение протокол взыскание проверка инспекция требование уведомление срок сроки
+валютный валютного валютная валюта контроль контроля экспорт импорт экспортный таможня таможенный
+таможенная пошлина внешнеэкономический контракт договор нерезидент нерезидента иностранный
+иностранная иностранной санкции санкций недружественные указ постановление письмо письма минфин
+разъяснения судебная практика изменения поправки законопроект упрощенка спецрежим
+"""
+
+_FOLD_TABLE = str.maketrans({"ё": "е"})
+_NON_WORD_RE = re.compile(r"[^\w]+|_")
+_WORD_RE = re.compile(r"[а-яa-z0-9]+")
+_CYRILLIC_RE = re.compile(r"^[а-я]+$")
+_ABBR_SUFFIX_RE = re.compile(
+    rf"\b({'|'.join(sorted(ABBREVIATIONS, key=len, reverse=True))})-?(?:ами|ах|ом|ой|ов|а|у|е|ы)\b"
+)
+
+_REFLEXIVE = ("ся", "сь")
+_ENDINGS = sorted(
+    {
+        # прилагательные и причастия
+        "ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой",
+        "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+        # глаголы
+        "ать", "ять", "еть", "ить", "ыть", "уть", "ешь", "ишь", "ете", "ите", "ила", "ыла",
+        "ена", "или", "ыли", "ило", "ыло", "ено", "ует", "уют", "ет", "ит", "ут", "ют", "ат", "ят",
+        "ил", "ыл", "ен",
+        # существительные
+        "иями", "ями", "ами", "иях", "ях", "ах", "иям", "ям", "ам", "ием", "ией", "ев", "ов",
+        "ии", "ия", "ью", "ья", "ье", "ию", "а", "е", "и", "о", "у", "ы", "ь", "ю", "я", "й",
+    },
+    key=len,
+    reverse=True,
+)
+_MIN_STEM = 3
+
+
+def fold(text: str) -> str:
+    """Нижний регистр, ё → е, без пунктуации и окончаний после аббревиатур."""
+    text = text.lower().translate(_FOLD_TABLE)
+    text = _ABBR_SUFFIX_RE.sub(r"\1", text)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    """Легкий стемминг: отрезает возвратную частицу и одно окончание."""
+    if word in ABBREVIATIONS or len(word) <= _MIN_STEM or not _CYRILLIC_RE.match(word):
+        return word
+    for suffix in _REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) > _MIN_STEM:
+            word = word[: -len(suffix)]
+            break
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            word = word[: -len(ending)]
+            break
+    # «налоговая» и «налог» — одна основа
+    if word.endswith(("ов", "ев")) and len(word) - 2 >= _MIN_STEM + 1:
+        word = word[:-2]
+    return word
+
+
+def _distance(a: str, b: str, limit: int) -> int:
+    """
+    Расстояние Дамерау–Левенштейна (с перестановкой соседних букв) с отсечкой:
+    считается только полоса шириной limit вокруг диагонали, больше limit — limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    n = len(b)
+    prev2: list[int] = []
+    prev = [j if j <= limit else over for j in range(n + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [over] * (n + 1)
+        if i <= limit:
+            cur[0] = i
+        lo = max(1, i - limit)
+        hi = min(n, i + limit)
+        row_min = cur[0]
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, prev2[j - 2] + 1)
+            cur[j] = min(value, over)
+            row_min = min(row_min, cur[j])
+        if row_min > limit:
+            return over
+        prev2, prev = prev, cur
+    return prev[n]
+
+
+class SymSpell:
+    """
+    Исправление опечаток по заранее построенному словарю удалений.
+
+    Для каждого слова словаря хранятся все варианты его префикса с удалением
+    до max_distance букв; кандидаты для слова с опечаткой — слова с общим
+    вариантом удаления, затем проверяется настоящее расстояние.
+    """
+
+    CORRECTIONS_CACHE = 50_000
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words: dict[str, int] = {}
+        self._deletes: dict[str, list[str]] = {}
+        self._corrections: dict[str, str] = {}
+
+    def _edits(self, word: str, distance: int) -> set[str]:
+        edits = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+            edits |= frontier
+        return edits
+
+    def add(self, word: str, count: int = 1, index: bool = True):
+        """Добавляет слово; index=False — только известное слово, без кандидатов на замену."""
+        known = word in self.words
+        self.words[word] = self.words.get(word, 0) + count
+        if index and not known:
+            for edit in self._edits(word[: self.prefix_length], self.max_distance):
+                self._deletes.setdefault(edit, []).append(word)
+
+    def _limit(self, word: str) -> int:
+        if len(word) < 5:
+            return 0
+        return 1 if len(word) < 9 else min(2, self.max_distance)
+
+    def _best(self, word: str, limit: int) -> str | None:
+        best = None
+        best_key = (limit + 1, 0)
+        checked: set[str] = set()
+        for edit in self._edits(word[: self.prefix_length], limit):
+            for candidate in self._deletes.get(edit, ()):
+                # Опечатка в первой букве редка, а ложных исправлений без этого много
+                if candidate in checked or candidate[0] != word[0]:
+                    continue
+                checked.add(candidate)
+                distance = _distance(word, candidate, limit)
+                key = (distance, -self.words[candidate])
+                if distance <= limit and key < best_key:
+                    best, best_key = candidate, key
+        return best
+
+    def correct(self, word: str) -> str:
+        if word in self.words or word in ABBREVIATIONS or not _CYRILLIC_RE.match(word):
+            return word
+        cached = self._corrections.get(word)
+        if cached is not None:
+            return cached
+        best = None
+        # Сначала ищем на расстоянии 1: кандидатов меньше, и почти все опечатки такие
+        for limit in range(1, self._limit(word) + 1):
+            best = self._best(word, limit)
+            if best:
+                break
+        if len(self._corrections) >= self.CORRECTIONS_CACHE:
+            self._corrections.clear()
+        self._corrections[word] = best or word
+        return best or word
+
+
+def _build_phrases() -> dict[tuple[str, ...], str]:
+    phrases = {}
+    for phrase, canonical in SYNONYMS.items():
+        phrases[tuple(stem(w) for w in fold(phrase).split())] = canonical
+    return phrases
+
+
+class QueryNormalizer:
+    # Слова из словаря предметной области выигрывают у частых слов корпуса
+    LEXICON_WEIGHT = 1_000_000
+
+    def __init__(self):
+        self._phrases = _build_phrases()
+        self._max_phrase = max(len(p) for p in self._phrases)
+        self._phrase_starts = {p[0] for p in self._phrases}
+        self._speller = self._base_speller()
+        self._lock = threading.Lock()
+        self._analyze = lru_cache(maxsize=4096)(self._analyze_uncached)
+
+    def _base_speller(self) -> SymSpell:
+        speller = SymSpell()
+        words = LEXICON.split() + [w for phrase in SYNONYMS for w in fold(phrase).split()]
+        for word in words:
+            if len(word) > 2:
+                speller.add(word, self.LEXICON_WEIGHT)
+        return speller
+
+    def warm_up(self):
+        """Строит словарь опечаток по корпусу data/ (вызывается при старте)."""
+        with self._lock:
+            counts: Counter = Counter()
+            for topic in article_index.law_files:
+                for title, text in article_index.articles(topic).values():
+                    counts.update(_WORD_RE.findall(fold(f"{title} {text}")))
+            speller = self._base_speller()
+            for rank, (word, count) in enumerate(counts.most_common()):
+                if len(word) > 2 and not word.isdigit():
+                    speller.add(word, count, index=rank < config.QUERY_SPELL_VOCAB)
+            self._speller = speller
+            self._analyze.cache_clear()
+        logger.info(f"Query speller: {len(speller.words)} words, {len(speller._deletes)} deletes")
+
+    def _canonical(self, words: list[str]) -> list[str]:
+        stems = [stem(w) for w in words]
+        result: list[str] = []
+        i = 0
+        while i < len(words):
+            if stems[i] not in self._phrase_starts:
+                result.append(words[i])
+                i += 1
+                continue
+            for n in range(min(self._max_phrase, len(words) - i), 0, -1):
+                canonical = self._phrases.get(tuple(stems[i:i + n]))
+                if canonical:
+                    result.append(canonical)
+                    i += n
+                    break
+            else:
+                result.append(words[i])
+                i += 1
+        return result
+
+    def _analyze_uncached(self, text: str) -> tuple[str, ...]:
+        speller = self._speller
+        words = [speller.correct(w) for w in fold(text).split()]
+        return tuple(self._canonical(words))
+
+    def words(self, text: str) -> tuple[str, ...]:
+        return self._analyze(text)
+
+    def text_words(self, text: str) -> list[str]:
+        return self._canonical(fold(text).split())
+
+
+query_normalizer = QueryNormalizer()
+
+
+def normalize_query(text: str) -> str:
+    """Вопрос в канонической форме: для проверки ключевых слов и регулярных выражений."""
+    return " ".join(query_normalizer.words(text))
+
+
+def _to_terms(words) -> list[str]:
+    return [stem(w) for w in words if (len(w) > 2 or w in ABBREVIATIONS) and w not in STOPWORDS]
+
+
+def query_terms(text: str) -> list[str]:
+    """Термины вопроса (с исправлением опечаток и синонимами)."""
+    return _to_terms(query_normalizer.words(text))
+
+
+def text_terms(text: str) -> list[str]:
+    """Термины документа: без исправления опечаток, это быстрее на больших текстах."""
+    return _to_terms(query_normalizer.text_words(text))
+
+
+def cache_key(text: str) -> str:
+    """Ключ кэша: стоп-слова сохраняются, чтобы «не» не склеивало разные вопросы."""
+    return " ".join(stem(w) for w in query_normalizer.words(text))
+
+
+def match_keywords(normalized: str, keywords) -> list[str]:
+    """
+    Ключевые слова, с которых начинается какое-либо слово нормализованного текста;
+    ключ с пробелом на конце («указ ») совпадает только со словом целиком.
+    """
+    padded = f" {normalized} "
+    return [k for k in keywords if f" {k}" in padded]
@@ -1,38 +1,40 @@
+from bot.query_norm import match_keywords, normalize_query
+
+TAX_KEYWORDS = [
+    "налог", "ндс", "ндфл", "ип", "самозанят", "усн", "осно", "нпд", "псн",
+    "вычет", "декларац", "отчет", "нк", "фнс"
+]
+
+KOAP_KEYWORDS = [
+    "штраф", "административ", "нарушен", "правонарушен", "коап", "ответственност",
+    "взыскан", "протокол"
+]
+
+VED_KEYWORDS = [
+    "вэд", "импорт", "экспорт", "таможн", "внешнеэкономическ",
+    "контракт", "валют"
+]
+
+
 def detect_topic(query: str) -> str:
     """
     Определяет тему запроса для выбора нужного файла законов
-    
+
+    Ключевые слова сравниваются с началом слов нормализованного запроса
+    (регистр, опечатки, синонимы и аббревиатуры — см. bot/query_norm.py).
+
     Returns:
         "tax" | "koap" | "ved" | "general"
     """
-    query_lower = query.lower()
-    
-    tax_keywords = [
-        "налог", "ндс", "налоговая", "ип", "самозанятый", "усн", "осно",
-        "вычет", "декларация", "отчет", "6-ндфл", "нк рф", "фнс"
-    ]
-    
-    koap_keywords = [
-        "штраф", "административ", "нарушение", "коап", "ответственность",
-        "взыскание", "протокол"
-    ]
-    
-    ved_keywords = [
-        "вэд", "импорт", "экспорт", "таможня", "внешнеэкономическ",
-        "контракт", "валют", "валюта", "валютный"
-    ]
-    
-    for keyword in tax_keywords:
-        if keyword in query_lower:
-            return "tax"
-    
-    for keyword in koap_keywords:
-        if keyword in query_lower:
-            return "koap"
-    
-    for keyword in ved_keywords:
-        if keyword in query_lower:
-            return "ved"
-    
-    return "tax"
+    text = normalize_query(query)
+
+    if match_keywords(text, TAX_KEYWORDS):
+        return "tax"
 
+    if match_keywords(text, KOAP_KEYWORDS):
+        return "koap"
+
+    if match_keywords(text, VED_KEYWORDS):
+        return "ved"
+
+    return "tax"
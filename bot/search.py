@@ -1,11 +1,21 @@
 import asyncio
+import heapq
 import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
 import aiohttp
 
+from bot.accounting import record_search_call
 from bot.config import config
+from bot.deadline import budget_allows, search_reserve, stage_timeout
+from bot.logs import redact
+from bot.query_norm import cache_key, match_keywords, normalize_query, query_terms, text_terms
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +24,51 @@ class TavilySearch:
     def __init__(self):
         self.api_key = config.TAVILY_API_KEY
         self.base_url = "https://api.tavily.com/search"
+        self._cache: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        # Одна сессия (пул соединений) на процесс вместо новой на каждый запрос
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def start(self):
+        self._get_session()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _cache_key(self, query: str) -> str:
+        # Кэш общий для ботов процесса: боты с другими доменами, страной или датами
+        # поиска получают свои записи
+        scope = (
+            config.TAVILY_SEARCH_DEPTH, config.TAVILY_MAX_RESULTS, config.TAVILY_COUNTRY,
+            config.TAVILY_START_DATE, config.TAVILY_END_DATE, ",".join(config.TAVILY_INCLUDE_DOMAINS),
+        )
+        return f"{cache_key(query)}|{'|'.join(map(str, scope))}"
+
+    def get_cached(self, query: str) -> list[dict] | None:
+        """Результаты из кэша, если они не старше SEARCH_CACHE_TTL."""
+        key = self._cache_key(query)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored_at, results = entry
+        if time.monotonic() - stored_at > config.SEARCH_CACHE_TTL:
+            self._cache.pop(key, None)
+            return None
+        self._cache.move_to_end(key)
+        return results
+
+    def _cache_put(self, query: str, results: list[dict]):
+        key = self._cache_key(query)
+        self._cache[key] = (time.monotonic(), results)
+        self._cache.move_to_end(key)
+        while len(self._cache) > config.SEARCH_CACHE_SIZE:
+            self._cache.popitem(last=False)
 
     async def search_results(self, query: str) -> list[dict]:
         """Поиск актуальной информации через Tavily (сырые результаты)."""
@@ -21,7 +76,12 @@ class TavilySearch:
             logger.warning("Tavily API key is missing; web search disabled.")
             return []
 
-        logger.info(f"Tavily search triggered for: {query}")
+        cached = self.get_cached(query)
+        if cached is not None:
+            logger.debug("Tavily cache hit for: %s", redact(query))
+            return cached
+
+        logger.info("Tavily search triggered for: %s", redact(query))
         country = (getattr(config, "TAVILY_COUNTRY", "Russia") or "").strip()
         payload: dict[str, Any] = {
             "query": query,
@@ -41,38 +101,45 @@ class TavilySearch:
             else:
                 payload["end_date"] = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         if payload.get("start_date") or payload.get("end_date"):
-            logger.info(
-                "Tavily date filter: "
-                f"{payload.get('start_date', '-')}"
-                f"..{payload.get('end_date', '-')}"
-            )
+            logger.debug("Tavily date filter: %s..%s", payload.get("start_date", "-"), payload.get("end_date", "-"))
         if country:
             payload["country"] = country
 
-        timeout = aiohttp.ClientTimeout(total=15)
+        budget = stage_timeout(config.SEARCH_TIMEOUT_SECONDS, reserve=search_reserve())
+        if budget < 1.0:
+            logger.warning("Tavily search skipped: request time budget is exhausted")
+            return []
+        timeout = aiohttp.ClientTimeout(total=budget)
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
         try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(self.base_url, json=payload, headers=headers) as resp:
-                    if resp.status != 200:
-                        text = await resp.text()
-                        if resp.status == 400 and "Invalid country" in text and "country" in payload:
-                            logger.warning("Tavily country invalid, retrying without country filter.")
-                            payload.pop("country", None)
-                            async with session.post(self.base_url, json=payload, headers=headers) as resp2:
-                                if resp2.status != 200:
-                                    text2 = await resp2.text()
-                                    logger.error(f"Tavily error: {resp2.status} {text2}")
-                                    return []
-                                data = await resp2.json()
-                        else:
-                            logger.error(f"Tavily error: {resp.status} {text}")
-                            return []
+            session = self._get_session()
+            record_search_call()
+            async with session.post(self.base_url, json=payload, headers=headers, timeout=timeout) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    retry_budget = stage_timeout(config.SEARCH_TIMEOUT_SECONDS, reserve=search_reserve())
+                    if (
+                        resp.status == 400 and "Invalid country" in text and "country" in payload
+                        and retry_budget >= 1.0
+                    ):
+                        logger.warning("Tavily country invalid, retrying without country filter.")
+                        payload.pop("country", None)
+                        record_search_call()
+                        retry_timeout = aiohttp.ClientTimeout(total=retry_budget)
+                        async with session.post(self.base_url, json=payload, headers=headers, timeout=retry_timeout) as resp2:
+                            if resp2.status != 200:
+                                text2 = await resp2.text()
+                                logger.error(f"Tavily error: {resp2.status} {text2}")
+                                return []
+                            data = await resp2.json()
                     else:
-                        data = await resp.json()
+                        logger.error(f"Tavily error: {resp.status} {text}")
+                        return []
+                else:
+                    data = await resp.json()
         except asyncio.TimeoutError:
             logger.error("Tavily request timed out")
             return []
@@ -81,6 +148,7 @@ class TavilySearch:
             return []
 
         results = data.get("results") or []
+        self._cache_put(query, results)
         if not results:
             logger.info("Tavily search returned 0 results.")
             return []
@@ -110,6 +178,151 @@ def _extract_date(item: dict) -> str:
     return ""
 
 
+_WORD_RE = re.compile(r"[а-яёa-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+(?=[А-ЯЁA-Z0-9«\"(])")
+_DATE_YEAR_RE = re.compile(r"(19|20)\d\d")
+# Трекинговые параметры: utm_* по префиксу, остальные — только точным именем
+# (reference=, refid=, from_date= — настоящие параметры страницы)
+_TRACKING_PREFIXES = ("utm_",)
+_TRACKING_PARAMS = frozenset({"yclid", "gclid", "fbclid", "from", "ref"})
+
+# Сигнатура текста — bottom-k: k наименьших crc32 его шинглов (один хэш вместо
+# 64 перестановок MinHash); схожесть оценивается по k наименьшим хэшам объединения
+_SKETCH_SIZE = 64
+
+
+def _terms(text: str) -> set[str]:
+    return set(text_terms(text))
+
+
+def canonical_url(url: str) -> str:
+    """URL без схемы, www/m., якоря, трекинговых параметров и завершающего слеша."""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip().lower()
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PREFIXES) and k.lower() not in _TRACKING_PARAMS
+    ))
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def _minhash(text: str) -> list[int]:
+    words = _WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+    return heapq.nsmallest(_SKETCH_SIZE, {zlib.crc32(sh.encode("utf-8")) for sh in shingles if sh})
+
+
+def _similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    """Оценка коэффициента Жаккара по двум bottom-k сигнатурам (точная для коротких текстов)."""
+    if not sig_a or not sig_b:
+        return 0.0
+    set_a, set_b = set(sig_a), set(sig_b)
+    union = heapq.nsmallest(_SKETCH_SIZE, set_a | set_b)
+    return sum(h in set_a and h in set_b for h in union) / len(union)
+
+
+def _recency_score(item: dict) -> float:
+    match = _DATE_YEAR_RE.search(_extract_date(item))
+    if not match:
+        return 0.3
+    age = datetime.now(timezone.utc).year - int(match.group(0))
+    return 1.0 / (1.0 + max(0, age))
+
+
+def compress_snippet(content: str, query_terms: set[str], max_chars: int) -> str:
+    """Убирает повторы предложений и оставляет те, где есть термины запроса."""
+    content = " ".join(content.split())
+    sentences: list[str] = []
+    seen: set[str] = set()
+    for sentence in _SENTENCE_RE.split(content):
+        key = sentence.lower()
+        if key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    content = " ".join(sentences)
+    if len(content) <= max_chars:
+        return content
+    scored = sorted(
+        range(len(sentences)),
+        key=lambda i: (-len(_terms(sentences[i]) & query_terms), i),
+    )
+    keep: list[int] = []
+    total = 0
+    for idx in scored:
+        length = len(sentences[idx]) + 1
+        if total + length > max_chars and keep:
+            continue
+        keep.append(idx)
+        total += length
+        if total >= max_chars:
+            break
+    snippet = " ".join(sentences[i] for i in sorted(keep))
+    return snippet[:max_chars]
+
+
+class DedupState:
+    """Уже выбранные источники: общие для всех поисков одного запроса."""
+
+    def __init__(self):
+        self.urls: set[str] = set()
+        self.signatures: list[list[int]] = []
+
+
+def postprocess_results(
+    results: list[dict],
+    query: str,
+    seen: DedupState | None = None,
+    limit: int | None = None,
+) -> list[dict]:
+    """Убирает дубли (URL и почти одинаковый текст), ранжирует и сжимает сниппеты."""
+    seen = seen or DedupState()
+    q_terms = set(query_terms(query))
+    threshold = config.SEARCH_DEDUP_THRESHOLD
+
+    ranked: list[tuple[float, dict]] = []
+    for item in results:
+        content = (item.get("content") or item.get("snippet") or "").strip()
+        relevance = len(_terms(f"{item.get('title') or ''} {content}") & q_terms) / (len(q_terms) or 1)
+        engine = float(item.get("score") or 0.0)
+        score = 0.6 * relevance + 0.25 * _recency_score(item) + 0.15 * min(1.0, engine)
+        ranked.append((score, item))
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+
+    kept: list[dict] = []
+    dropped = 0
+    for _, item in ranked:
+        url = (item.get("url") or "").strip()
+        content = (item.get("content") or item.get("snippet") or "").strip()
+        key = canonical_url(url) if url else ""
+        if key and key in seen.urls:
+            dropped += 1
+            continue
+        signature = _minhash(content)
+        if any(_similarity(signature, other) >= threshold for other in seen.signatures):
+            dropped += 1
+            continue
+        if key:
+            seen.urls.add(key)
+        if signature:
+            seen.signatures.append(signature)
+        item = dict(item)
+        item["content"] = compress_snippet(content, q_terms, config.SEARCH_SNIPPET_MAX_CHARS)
+        kept.append(item)
+        if limit and len(kept) >= limit:
+            break
+
+    if dropped:
+        logger.debug("Search post-processing dropped %d duplicate results.", dropped)
+    return kept
+
+
 def format_results(results: list[dict]) -> str:
     formatted: list[str] = []
     for item in results:
@@ -131,17 +344,17 @@ def format_results(results: list[dict]) -> str:
 
 def prepare_search_query(user_query: str) -> str:
     """Улучшает поисковый запрос для более точных результатов."""
-    q = user_query.lower()
+    q = normalize_query(user_query)
 
-    if ("продаж" in q or "реализац" in q) and ("дол" in q or "участ" in q):
-        if "организац" in q or "компани" in q or "ооо" in q:
+    if match_keywords(q, ("продаж", "реализац")) and match_keywords(q, ("дол", "участ")):
+        if match_keywords(q, ("организац", "компани", "ооо")):
             return f"{user_query} налог на прибыль организаций статья 280 НК РФ письмо Минфина"
         return f"{user_query} НДФЛ статья 217 НК РФ"
 
-    if "иностран" in q or "нерезидент" in q or "катар" in q:
+    if match_keywords(q, ("иностран", "нерезидент", "катар")):
         return f"{user_query} валютный контроль санкции ЦБ РФ"
 
-    if "санкци" in q or "ограничен" in q or "запрет" in q:
+    if match_keywords(q, ("санкци", "ограничен", "запрет")):
         return f"{user_query} указ президента санкции недружественные страны"
 
     return user_query
@@ -150,37 +363,62 @@ def prepare_search_query(user_query: str) -> str:
 tavily_search = TavilySearch()
 
 
-async def web_search(query: str) -> str:
-    """Поиск через Tavily для юридических запросов (с улучшенным запросом)."""
+async def _search_results(query: str) -> list[dict]:
+    """Сырые результаты Tavily по улучшенному запросу."""
     enhanced_query = prepare_search_query(query)
     if enhanced_query != query:
-        logger.info(f"Tavily search: original='{query}', enhanced='{enhanced_query}'")
-    results = await tavily_search.search_results(enhanced_query)
-    return format_results(results)
+        logger.debug("Tavily search: original=%s, enhanced=%s", redact(query), redact(enhanced_query))
+    return await tavily_search.search_results(enhanced_query)
 
 
-async def web_search_multi(user_query: str) -> str:
-    """Делает несколько поисков для комплексных вопросов."""
-    q = user_query.lower()
-    contexts: list[str] = []
+def _format_search(results: list[dict], query: str, seen: DedupState | None) -> str:
+    results = postprocess_results(results, query, seen=seen, limit=config.TAVILY_MAX_RESULTS)
+    return format_results(results)
 
-    main_context = await web_search(user_query)
-    if main_context:
-        contexts.append(main_context)
 
-    if "иностран" in q or "нерезидент" in q:
-        currency_query = "валютный контроль сделки с нерезидентами ЦБ РФ 2026"
-        currency_context = await web_search(currency_query)
-        if currency_context:
-            contexts.append("--- Дополнительно: валютный контроль ---\n" + currency_context)
+async def web_search(query: str, seen: DedupState | None = None) -> str:
+    """Поиск через Tavily для юридических запросов (с улучшенным запросом)."""
+    results = await _search_results(query)
+    # Термины, сигнатуры и сжатие сниппетов — чистый CPU: считаем вне event loop
+    return await asyncio.to_thread(_format_search, results, query, seen)
 
-        sanctions_query = "санкции недружественные страны указ президента сделки 2026"
-        sanctions_context = await web_search(sanctions_query)
-        if sanctions_context:
-            contexts.append("--- Дополнительно: санкции ---\n" + sanctions_context)
 
+async def web_search_multi(user_query: str) -> str:
+    """Делает несколько поисков для комплексных вопросов (запросы к Tavily идут одновременно)."""
+    q = normalize_query(user_query)
+    searches = [("", user_query)]
+
+    if match_keywords(q, ("иностран", "нерезидент")):
+        # Дополнительные поиски необязательны: без запаса времени отвечаем по основному
+        if budget_allows(config.SEARCH_EXTRA_MIN_SECONDS, reserve=search_reserve()):
+            searches += [
+                ("валютный контроль", "валютный контроль сделки с нерезидентами ЦБ РФ 2026"),
+                ("санкции", "санкции недружественные страны указ президента сделки 2026"),
+            ]
+        else:
+            logger.info("Extra searches skipped: low time budget")
+
+    results = await asyncio.gather(*(_search_results(query) for _, query in searches))
+
+    def merge() -> list[str]:
+        # Дубли отсеиваются и между поисками — всегда в порядке основной, валюта, санкции,
+        # чтобы ответ не зависел от того, какой запрос к Tavily вернулся первым
+        seen = DedupState()
+        contexts: list[str] = []
+        for (label, query), items in zip(searches, results):
+            context = _format_search(items, query, seen)
+            if context:
+                contexts.append(f"--- Дополнительно: {label} ---\n{context}" if label else context)
+        return contexts
+
+    contexts = await asyncio.to_thread(merge)
     return "\n\n===\n\n".join(contexts) if contexts else ""
 
 
+def is_search_cached(user_query: str) -> bool:
+    """Основной запрос уже есть в кэше — поиск ничего не будет стоить."""
+    return tavily_search.get_cached(prepare_search_query(user_query)) is not None
+
+
 async def get_tavily_search(query: str) -> str:
     return await web_search_multi(query)
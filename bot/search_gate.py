@@ -0,0 +1,158 @@
+"""
+Решение о веб-поиске по тому, насколько локальный корпус покрывает вопрос.
+
+Tavily вызывается, только если вопрос про свежие изменения, требует
+внешних источников (практика, письма, санкции) или плохо покрыт статьями
+из data/. Решение и причины пишутся в лог.
+"""
+import logging
+import math
+import re
+import threading
+from typing import NamedTuple
+
+from bot.articles import article_index
+from bot.config import config
+from bot.query_norm import match_keywords, normalize_query, query_terms, text_terms
+from bot.search import is_search_cached
+
+logger = logging.getLogger(__name__)
+
+RECENCY_RE = re.compile(
+    r"изменени|нововведени|поправк|законопроект|вступ[а-яё]* в силу|с \d{1,2}\s+[а-яё]+\s+20\d\d"
+    r"|\b20[12]\d\s+(?:год|г\b)|\b(?:в|с|до|после|на|за|от|к)\s+20[12]\d\b|в этом году|в следующем году|последн[а-яё]* (?:верси|редакци|новост)|актуальн",
+    re.IGNORECASE,
+)
+
+# Этого нет в текстах кодексов: судебная практика, письма ведомств, санкции, валюта
+EXTERNAL_KEYWORDS = [
+    "судебн",
+    "практик",
+    "письмо",
+    "письма",
+    "разъяснен",
+    "минфин",
+    "фнс",
+    "санкц",
+    # «указ», но не «указать»
+    "указ ",
+    "указа ",
+    "указом ",
+    "указу ",
+    "указе ",
+    "постановлен",
+    "цб",
+    "cbr",
+    "валютн",
+    "нерезидент",
+    "иностранн",
+]
+
+
+class SearchDecision(NamedTuple):
+    search: bool
+    coverage: float
+    reasons: list[str]
+
+
+class CorpusCoverage:
+    """Инвертированный индекс «основа слова → статьи» по корпусу темы."""
+
+    def __init__(self):
+        # Храним сам словарь статей, а не id(): после перезагрузки корпуса
+        # id нового словаря может совпасть с id уже собранного старого
+        self._indexes: dict[str, tuple[dict, dict[str, set[str]], int]] = {}
+        # Индекс строится и из потока (_retrieve_law), и из event loop (решение о поиске)
+        self._lock = threading.Lock()
+
+    def _index(self, topic: str) -> tuple[dict[str, set[str]], int]:
+        articles = article_index.articles(topic)
+        with self._lock:
+            cached = self._indexes.get(topic)
+            if cached and cached[0] is articles:
+                return cached[1], cached[2]
+            postings: dict[str, set[str]] = {}
+            for number, (title, text) in articles.items():
+                for term in set(text_terms(f"{title} {text}")):
+                    postings.setdefault(term, set()).add(number)
+            self._indexes[topic] = (articles, postings, len(articles))
+            if articles:
+                logger.info(f"Coverage index for '{topic}': {len(postings)} terms")
+            return postings, len(articles)
+
+    def warm_up(self):
+        for topic in article_index.law_files:
+            self._index(topic)
+
+    def _article_weights(self, query: str, topic: str) -> tuple[dict[str, float], float]:
+        """Суммарный idf терминов вопроса по статьям и полный вес вопроса."""
+        terms = list(dict.fromkeys(query_terms(query)))
+        if not terms:
+            return {}, 0.0
+        postings, total = self._index(topic)
+        if not total:
+            return {}, 1.0
+        max_idf = math.log(1 + total)
+        weights: dict[str, float] = {}
+        per_article: dict[str, float] = {}
+        for term in terms:
+            docs = postings.get(term)
+            weight = math.log(1 + total / len(docs)) if docs else max_idf
+            weights[term] = weight
+            for number in docs or ():
+                per_article[number] = per_article.get(number, 0.0) + weight
+        return per_article, sum(weights.values())
+
+    def score(self, query: str, topic: str) -> float:
+        """Доля «веса» (idf) терминов вопроса, найденных в лучшей статье корпуса."""
+        per_article, total_weight = self._article_weights(query, topic)
+        if not total_weight:
+            return 1.0
+        if not per_article:
+            return 0.0
+        return max(per_article.values()) / total_weight
+
+    def best_articles(self, query: str, topic: str, limit: int) -> list[str]:
+        """Номера статей, лучше всего покрывающих вопрос (по убыванию веса)."""
+        per_article, _ = self._article_weights(query, topic)
+        return sorted(per_article, key=per_article.get, reverse=True)[:limit]
+
+
+corpus_coverage = CorpusCoverage()
+
+
+def decide_web_search(user_query: str, topic: str, has_exact_article: bool = False) -> SearchDecision:
+    q = normalize_query(user_query)
+    if not q:
+        return SearchDecision(False, 0.0, ["empty"])
+
+    reasons: list[str] = []
+    recent = bool(RECENCY_RE.search(q))
+    if recent:
+        reasons.append("recency")
+    if has_exact_article:
+        reasons.append("exact_article")
+        return SearchDecision(recent, 1.0, reasons)
+
+    external = match_keywords(q, EXTERNAL_KEYWORDS)
+    if external:
+        reasons.append(f"external:{','.join(k.strip() for k in external[:3])}")
+
+    coverage = corpus_coverage.score(q, topic)
+    low_coverage = coverage < config.SEARCH_COVERAGE_THRESHOLD
+    reasons.append(f"coverage={coverage:.2f}{'<' if low_coverage else '>='}{config.SEARCH_COVERAGE_THRESHOLD}")
+
+    cached = is_search_cached(user_query)
+    if cached:
+        reasons.append("cached")
+
+    return SearchDecision(recent or bool(external) or low_coverage or cached, coverage, reasons)
+
+
+def log_decision(decision: SearchDecision):
+    verdict = "enabled" if decision.search else "skipped"
+    # Поля extra JSON-формат выводит отдельными ключами
+    logger.info(
+        "Web search %s: %s", verdict, "; ".join(decision.reasons),
+        extra={"search": decision.search, "coverage": decision.coverage, "reasons": decision.reasons},
+    )
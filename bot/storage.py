@@ -1,36 +1,130 @@
+import re
 from collections import defaultdict, deque
+from typing import Awaitable, Callable, Hashable
+
+from bot.config import config
+
+DISCLAIMER_RE = re.compile(r"\s*Ответ сгенерирован ИИ.*$", re.DOTALL)
+CHECK_NOTE_RE = re.compile(r"\s*«?Требуется проверка в Консультант\+ или на pravo\.gov\.ru»?\.?", re.IGNORECASE)
+LINK_RE = re.compile(r"<a\s[^>]*>(.*?)</a>", re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"</?[a-z][^>]*>", re.IGNORECASE)
+SECTION_RE = re.compile(r"^\s*\d\.\s*(Суть|Норма|Практика|Рекомендация)\s*[—:-]?\s*", re.IGNORECASE | re.MULTILINE)
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+Summarizer = Callable[[str, list[dict], int], Awaitable[str]]
+
+
+def clean_answer(text: str) -> str:
+    """Убирает дисклеймер, ссылки и HTML-разметку перед сохранением в историю"""
+    text = DISCLAIMER_RE.sub("", text)
+    text = CHECK_NOTE_RE.sub("", text)
+    text = LINK_RE.sub(r"\1", text)
+    text = TAG_RE.sub("", text)
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def _first_sentences(text: str, limit: int) -> str:
+    text = " ".join(SECTION_RE.sub("", text).split())
+    out = ""
+    for sentence in SENTENCE_RE.split(text):
+        if out and len(out) + len(sentence) + 1 > limit:
+            break
+        out = f"{out} {sentence}".strip()
+    return out[:limit]
+
+
+async def extractive_summary(summary: str, turns: list[dict], max_chars: int) -> str:
+    """Дешевое сжатие без модели: вопрос и начало ответа («Суть») на строку"""
+    lines = [line for line in summary.splitlines() if line.strip()]
+    question = ""
+    for msg in turns:
+        if msg["role"] == "user":
+            question = _first_sentences(msg["content"], 200)
+        else:
+            answer = _first_sentences(msg["content"], 300)
+            lines.append(f"- Вопрос: {question} → Ответ: {answer}" if question else f"- Ответ: {answer}")
+            question = ""
+    if question:
+        lines.append(f"- Вопрос: {question}")
+    # Старые строки выпадают первыми
+    while lines and len("\n".join(lines)) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
 
 class ConversationStorage:
-    def __init__(self, max_pairs=2):
+    def __init__(self, max_pairs=2, summary_chars=1200, answer_chars=1500):
         self.storage = defaultdict(lambda: deque(maxlen=max_pairs * 2))
         self.max_pairs = max_pairs
-    
-    def add_message(self, user_id: int, role: str, content: str):
+        self.summary_chars = summary_chars
+        self.answer_chars = answer_chars
+        self.summaries: dict[Hashable, str] = {}
+        # Сообщения, вытесненные из окна и еще не свернутые в сводку
+        self.pending: dict[Hashable, list[dict]] = defaultdict(list)
+        # Пользователи, у которых сейчас идет сжатие (не больше одного на пользователя)
+        self._compressing: set[Hashable] = set()
+
+    def add_message(self, user_id: Hashable, role: str, content: str):
         """Добавить сообщение в историю"""
-        self.storage[user_id].append({"role": role, "content": content})
-    
-    def get_history(self, user_id: int) -> list:
+        if role == "assistant":
+            content = clean_answer(content)[:self.answer_chars]
+        history = self.storage[user_id]
+        if len(history) == history.maxlen:
+            self.pending[user_id].append(history[0])
+        history.append({"role": role, "content": content})
+
+    def get_history(self, user_id: Hashable) -> list:
         """Получить историю диалога"""
         return list(self.storage[user_id])
-    
-    def get_formatted_history(self, user_id: int) -> str:
+
+    def get_summary(self, user_id: Hashable) -> str:
+        return self.summaries.get(user_id, "")
+
+    def get_formatted_history(self, user_id: Hashable) -> str:
         """Получить историю в XML формате"""
         history = self.get_history(user_id)
-        if not history:
+        summary = self.get_summary(user_id)
+        if not history and not summary:
             return ""
-        
+
         formatted = []
+        if summary:
+            formatted.append(f"Краткое содержание предыдущего диалога:\n{summary}\n")
         for msg in history:
             role = "Пользователь" if msg["role"] == "user" else "Ассистент"
             formatted.append(f"{role}: {msg['content']}")
-        
+
         return "\n".join(formatted)
-    
-    def clear_history(self, user_id: int):
+
+    async def compress(self, user_id: Hashable, summarizer: Summarizer = extractive_summary):
+        """Сворачивает вытесненные сообщения в сводку (запускается в фоне после ответа)"""
+        # Два параллельных сжатия прочитали бы одну и ту же старую сводку, и одно
+        # перезаписало бы другое: идущее сжатие само заберет новые сообщения
+        if user_id in self._compressing:
+            return
+        self._compressing.add(user_id)
+        try:
+            while turns := self.pending.pop(user_id, None):
+                history = self.storage.get(user_id)
+                summary = await summarizer(self.get_summary(user_id), turns, self.summary_chars)
+                # Пока шло сжатие, пользователь мог очистить историю
+                if history is not None and self.storage.get(user_id) is history:
+                    self.summaries[user_id] = summary[:self.summary_chars]
+        finally:
+            self._compressing.discard(user_id)
+
+    def clear_history(self, user_id: Hashable):
         """Очистить историю пользователя"""
         if user_id in self.storage:
             del self.storage[user_id]
+        self.summaries.pop(user_id, None)
+        self.pending.pop(user_id, None)
 
 # Создаем глобальный объект, который будем импортировать
-conversation_storage = ConversationStorage(max_pairs=2)
-
+conversation_storage = ConversationStorage(
+    max_pairs=config.MAX_HISTORY_PAIRS,
+    summary_chars=config.HISTORY_SUMMARY_CHARS,
+    answer_chars=config.HISTORY_ANSWER_CHARS,
+)
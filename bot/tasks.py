@@ -0,0 +1,134 @@
+"""
+Реестр запросов пользователей, которые выполняются прямо сейчас.
+
+Если пользователь присылает уточнение, пока предыдущий вопрос еще ждет
+Tavily или модель, старый запрос по политике QUERY_SUPERSEDE_POLICY либо
+отменяется («cancel»: отмена доходит до HTTP-запросов и потока ответа
+модели, соединения закрываются, генерация токенов прекращается), либо
+дорабатывает, а новый вопрос ждет его и идет следом с его ответом в
+истории («merge»; несколько новых вопросов встают в очередь друг за
+другом). /clear и /start отменяют и выполняющийся запрос, и очередь.
+
+Когда ответ уже сгенерирован, запрос снимается с учета (release):
+отправлять готовый ответ дешево, отменять его поздно.
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Coroutine, Hashable
+
+from bot.config import config
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("cancel", "merge")
+
+
+class _Query:
+    """Запрос в реестре: задача и причина, по которой ее отменил реестр."""
+
+    __slots__ = ("task", "reason")
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.reason: str | None = None
+
+
+# Запрос, в котором выполняется код (наследуется этапами запроса)
+_current_query: contextvars.ContextVar[_Query | None] = contextvars.ContextVar("current_query", default=None)
+
+
+def cancel_reason() -> str | None:
+    """Почему отменен текущий запрос пользователя; None — не отменялся (например, таймаут этапа)."""
+    query = _current_query.get()
+    return query.reason if query is not None else None
+
+
+async def _after(previous: asyncio.Task | None, coro: Coroutine):
+    if previous is not None:
+        try:
+            # Ждем предыдущий вопрос, но не отменяем его вместе с этим
+            await asyncio.wait({previous})
+        except asyncio.CancelledError:
+            coro.close()
+            raise
+    return await coro
+
+
+class UserTaskRegistry:
+    def __init__(self, policy: str):
+        if policy not in POLICIES:
+            logger.warning(f"Unknown QUERY_SUPERSEDE_POLICY '{policy}', using 'cancel'")
+            policy = "cancel"
+        self.policy = policy
+        # Ключ — user_key: пользователь в конкретном боте. Сначала выполняющийся
+        # запрос, за ним — ждущие своей очереди (политика «merge»)
+        self._queries: dict[Hashable, list[_Query]] = {}
+        self.cancelled = 0
+
+    def _pending(self, user_id: Hashable) -> list[_Query]:
+        return [q for q in self._queries.get(user_id, ()) if q.task is not None and not q.task.done()]
+
+    def _remove(self, user_id: Hashable, query: _Query):
+        queries = self._queries.get(user_id)
+        if queries and query in queries:
+            queries.remove(query)
+            if not queries:
+                self._queries.pop(user_id, None)
+
+    def active(self, user_id: Hashable) -> asyncio.Task | None:
+        """Последний принятый и еще не отвеченный запрос пользователя."""
+        pending = self._pending(user_id)
+        return pending[-1].task if pending else None
+
+    def cancel(self, user_id: Hashable, reason: str) -> bool:
+        pending = self._pending(user_id)
+        self._queries.pop(user_id, None)
+        for query in pending:
+            query.reason = reason
+            query.task.cancel(msg=reason)
+        self.cancelled += len(pending)
+        if pending:
+            logger.info(f"Cancelled {len(pending)} running/queued queries of user {user_id}: {reason}")
+        return bool(pending)
+
+    def release(self, user_id: Hashable):
+        """Снимает текущий запрос пользователя с учета: его больше не отменяют и не ждут."""
+        query = _current_query.get()
+        if query is not None:
+            self._remove(user_id, query)
+
+    async def run(self, user_id: Hashable, coro: Awaitable) -> bool:
+        """
+        Выполняет запрос пользователя отдельной задачей с учетом предыдущих.
+
+        Возвращает False, если запрос отменили более новым сообщением или /clear.
+        """
+        previous = self.active(user_id)
+        if previous is not None:
+            if self.policy == "cancel":
+                self.cancel(user_id, "superseded by a newer message")
+                previous = None
+            else:
+                logger.info(f"User {user_id} has a running query; queueing the new one after it")
+
+        query = _Query()
+        context = contextvars.copy_context()
+        context.run(_current_query.set, query)
+        query.task = task = asyncio.create_task(_after(previous, coro), context=context)
+        self._queries.setdefault(user_id, []).append(query)
+        try:
+            await task
+            return True
+        except asyncio.CancelledError:
+            # Отменили сам обработчик (остановка бота) — пробрасываем дальше
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                task.cancel()
+                raise
+            return False
+        finally:
+            self._remove(user_id, query)
+
+
+user_tasks = UserTaskRegistry(config.QUERY_SUPERSEDE_POLICY)
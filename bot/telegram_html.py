@@ -0,0 +1,302 @@
+"""
+Подготовка HTML-ответа модели к отправке в Telegram (ParseMode.HTML).
+
+За один линейный проход текст проверяется и чинится под набор тегов,
+который понимает Telegram: неизвестные теги убираются, атрибуты
+фильтруются, одиночные «<» и «&» экранируются, перепутанная вложенность
+исправляется, незакрытые теги закрываются. Тут же текст режется на
+сообщения по границам абзацев и строк: в конце куска открытые теги
+закрываются, а в начале следующего — открываются заново.
+"""
+import re
+from html.entities import name2codepoint
+
+TELEGRAM_MAX_LEN = 4096
+
+# Синонимы приводятся к короткой форме
+_TAG_ALIASES = {
+    "b": "b", "strong": "b",
+    "i": "i", "em": "i",
+    "u": "u", "ins": "u",
+    "s": "s", "strike": "s", "del": "s",
+    "a": "a", "code": "code", "pre": "pre", "blockquote": "blockquote",
+    "tg-spoiler": "tg-spoiler", "span": "span", "tg-emoji": "tg-emoji",
+}
+# Заголовки модель иногда пишет как в вебе — показываем их жирным
+_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# Блочные теги убираются, вместо них — переносы строк
+_BLOCK_TAGS = {"p", "div", "ul", "ol", "li", "br", "hr", "tr", "table", "tbody", "thead", "td", "th"}
+
+_TOKEN_RE = re.compile(
+    r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)((?:[^<>\"']|\"[^\"]*\"|'[^']*')*)>"
+    r"|&(#[0-9]{1,7}|#[xX][0-9a-fA-F]{1,6}|[a-zA-Z][a-zA-Z0-9]{1,31});"
+    r"|[<>&]"
+)
+_ATTR_RE = re.compile(r"([a-zA-Z-]+)\s*(?:=\s*(\"[^\"]*\"|'[^']*'|[^\s\"'>]+))?")
+_ESCAPES = {"<": "&lt;", ">": "&gt;", "&": "&amp;"}
+_ESCAPE_RE = re.compile(r"[<>&]")
+_MIN_BREAK_SHARE = 0.3
+
+
+def escape(text: str) -> str:
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES[m.group(0)], text)
+
+
+def _units(text: str) -> int:
+    """Длина в единицах UTF-16 — так Telegram считает лимит сообщения."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _attrs(raw: str) -> dict[str, str]:
+    attrs: dict[str, str] = {}
+    for match in _ATTR_RE.finditer(raw):
+        value = match.group(2) or ""
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        attrs[match.group(1).lower()] = value
+    return attrs
+
+
+def _open_tag(name: str, raw_attrs: str) -> str | None:
+    """Открывающий тег с допустимыми атрибутами или None, если тег не нужен."""
+    if name in ("b", "i", "u", "s", "pre", "tg-spoiler"):
+        return f"<{name}>"
+    attrs = _attrs(raw_attrs)
+    if name == "a":
+        href = attrs.get("href", "").strip()
+        if not href:
+            return None
+        return f'<a href="{escape(href).replace(chr(34), "&quot;")}">'
+    if name == "code":
+        lang = attrs.get("class", "")
+        if lang.startswith("language-") and re.fullmatch(r"language-[\w+#.-]+", lang):
+            return f'<code class="{lang}">'
+        return "<code>"
+    if name == "span":
+        return "<span class=\"tg-spoiler\">" if attrs.get("class") == "tg-spoiler" else None
+    if name == "blockquote":
+        return "<blockquote expandable>" if "expandable" in attrs else "<blockquote>"
+    if name == "tg-emoji":
+        emoji_id = attrs.get("emoji-id", "")
+        return f'<tg-emoji emoji-id="{emoji_id}">' if emoji_id.isdigit() else None
+    return None
+
+
+def _entity_text(name: str) -> str:
+    """Символ сущности; неизвестная или битая сущность остается текстом «&name;»."""
+    if name[0] == "#":
+        try:
+            code = int(name[2:], 16) if name[1] in "xX" else int(name[1:])
+            if code and not 0xD800 <= code <= 0xDFFF:
+                return chr(code)
+        except (ValueError, OverflowError):
+            pass
+        return f"&{name};"
+    code = name2codepoint.get(name)
+    return chr(code) if code else f"&{name};"
+
+
+def _has_text(html: str) -> bool:
+    return bool(_TOKEN_RE.sub("", html).strip())
+
+
+class _ChunkWriter:
+    """Собирает куски не длиннее limit и помнит, где их удобно разрезать."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.chunks: list[str] = []
+        # (фрагмент HTML, длина, имя открытого тега / "/" для закрывающего / "" для текста)
+        self.parts: list[tuple[str, int, str]] = []
+        self.size = 0
+        # (имя, открывающий тег) открытых сейчас тегов
+        self.stack: list[tuple[str, str]] = []
+        self.closing = 0
+        # Последние разрывы строки и абзаца: (индекс в parts, размер, открытые теги)
+        self.line_break: tuple[int, int, tuple] | None = None
+        self.para_break: tuple[int, int, tuple] | None = None
+
+    def _append(self, piece: str, kind: str = "") -> int:
+        size = _units(piece)
+        self.parts.append((piece, size, kind))
+        self.size += size
+        return size
+
+    def open(self, name: str, tag: str):
+        if self.size + _units(tag) + len(name) + 3 + self.closing > self.limit:
+            self._flush_somewhere()
+        self._append(tag, name)
+        self.stack.append((name, tag))
+        self.closing += len(name) + 3
+
+    def close(self, name: str):
+        self._append(f"</{name}>", "/")
+        self.stack.pop()
+        self.closing -= len(name) + 3
+
+    def text(self, raw: str):
+        """Добавляет неэкранированный текст, при необходимости разрезая его."""
+        for line in raw.splitlines(keepends=True):
+            while line:
+                piece = escape(line)
+                if self.size + _units(piece) + self.closing <= self.limit:
+                    self._append(piece)
+                    if line.endswith("\n"):
+                        self._mark_break(len(self.parts), self.size, tuple(self.stack))
+                    break
+                if self._flush_at_break():
+                    continue
+                room = self.limit - self.size - self.closing
+                if room < self.limit * _MIN_BREAK_SHARE and _has_text(self._joined()):
+                    self._flush(len(self.parts), tuple(self.stack))
+                    continue
+                head, line = _cut_line(line, max(room, 1))
+                self._append(escape(head))
+                self._flush(len(self.parts), tuple(self.stack))
+
+    def _joined(self) -> str:
+        return "".join(piece for piece, _, _ in self.parts)
+
+    def _mark_break(self, index: int, size: int, stack: tuple):
+        point = (index, size, stack)
+        # Пустая строка (два переноса подряд) — граница абзаца
+        prev = self.parts[index - 2][0] if index > 1 else ""
+        if self.parts[index - 1][0] == "\n" or prev.endswith("\n"):
+            self.para_break = point
+        self.line_break = point
+
+    def _flush_at_break(self) -> bool:
+        min_size = self.limit * _MIN_BREAK_SHARE
+        for point in (self.para_break, self.line_break):
+            if point and point[1] >= min_size:
+                self._flush(point[0], point[2])
+                return True
+        return False
+
+    def _flush_somewhere(self):
+        if not self._flush_at_break() and self.parts:
+            self._flush(len(self.parts), tuple(self.stack))
+
+    def _flush(self, index: int, stack: tuple):
+        head = "".join(piece for piece, _, _ in self.parts[:index])
+        head += "".join(f"</{name}>" for name, _ in reversed(stack))
+        if _has_text(head):
+            self.chunks.append(head.strip())
+        tail = self.parts[index:]
+        self.parts = []
+        self.size = 0
+        self.line_break = self.para_break = None
+        for name, tag in stack:
+            self._append(tag, name)
+        # Разрывы в перенесенном хвосте находим заново
+        open_now = list(stack)
+        for piece, size, kind in tail:
+            self.parts.append((piece, size, kind))
+            self.size += size
+            if kind == "/":
+                open_now.pop()
+            elif kind:
+                open_now.append((kind, piece))
+            elif piece.endswith("\n"):
+                self._mark_break(len(self.parts), self.size, tuple(open_now))
+
+    def finish(self) -> list[str]:
+        while self.stack:
+            self.close(self.stack[-1][0])
+        tail = self._joined()
+        if _has_text(tail):
+            self.chunks.append(tail.strip())
+        return self.chunks
+
+
+def _cut_line(line: str, room: int) -> tuple[str, str]:
+    """Режет строку без переносов по последнему пробелу, помещающемуся в room."""
+    cut = min(len(line), room)
+    while cut > 1:
+        # Экранирование и суррогатные пары удлиняют текст — подрезаем пропорционально
+        units = _units(escape(line[:cut]))
+        if units <= room:
+            break
+        cut = max(1, min(cut - 1, cut * room // units))
+    space = line.rfind(" ", 0, cut)
+    if space > cut * _MIN_BREAK_SHARE:
+        cut = space + 1
+    return line[:cut], line[cut:]
+
+
+def format_html(text: str, limit: int = TELEGRAM_MAX_LEN) -> list[str]:
+    """Исправляет HTML под Telegram и режет его на сообщения не длиннее limit."""
+    writer = _ChunkWriter(limit)
+    pending: list[str] = []
+
+    def flush_text():
+        if pending:
+            writer.text("".join(pending))
+            pending.clear()
+
+    pos = 0
+    for match in _TOKEN_RE.finditer(text):
+        if match.start() > pos:
+            pending.append(text[pos:match.start()])
+        pos = match.end()
+        token = match.group(0)
+        if match.group(4):
+            pending.append(_entity_text(match.group(4)))
+            continue
+        if match.group(2) is None:
+            # Одиночные «<», «>», «&» — writer их экранирует
+            pending.append(token)
+            continue
+
+        closing, raw_name, raw_attrs = match.group(1), match.group(2).lower(), match.group(3)
+        open_names = [name for name, _ in writer.stack]
+        # Внутри <pre>/<code> Telegram разметку не разбирает — теги идут текстом
+        if ("pre" in open_names or "code" in open_names) and raw_name not in ("pre", "code"):
+            pending.append(token)
+            continue
+
+        if raw_name in _BLOCK_TAGS:
+            if raw_name == "li" and not closing:
+                pending.append("\n• ")
+            elif raw_name in ("br", "hr") or (closing and raw_name not in ("li", "td", "th")):
+                pending.append("\n")
+            continue
+        name = "b" if raw_name in _HEADING_TAGS else _TAG_ALIASES.get(raw_name)
+        if name is None:
+            continue
+
+        if closing:
+            if name not in open_names:
+                continue
+            flush_text()
+            # </b> при открытом внутри <i>: закрываем <i> и <b>, затем снова открываем <i>
+            reopen: list[tuple[str, str]] = []
+            while writer.stack[-1][0] != name:
+                reopen.append(writer.stack[-1])
+                writer.close(writer.stack[-1][0])
+            writer.close(name)
+            for reopened_name, tag in reversed(reopen):
+                writer.open(reopened_name, tag)
+            if raw_name in _HEADING_TAGS:
+                pending.append("\n")
+            continue
+
+        # Одинаковые вложенные теги (в том числе ссылка в ссылке) Telegram не принимает
+        tag = _open_tag(name, raw_attrs)
+        if tag is None or name in open_names:
+            continue
+        flush_text()
+        writer.open(name, tag)
+
+    if pos < len(text):
+        pending.append(text[pos:])
+    flush_text()
+    return writer.finish()
+
+
+def sanitize_html(text: str) -> str:
+    """Исправленный HTML одним куском, без ограничения длины."""
+    chunks = format_html(text, limit=max(_units(text) * 6, TELEGRAM_MAX_LEN))
+    return "\n".join(chunks)
@@ -0,0 +1,37 @@
+"""
+Общий пул процессов для CPU-тяжелой обработки вложений (изображения, OCR, PDF).
+
+Функции, отправляемые в пул, должны быть объявлены на уровне модуля
+и принимать/возвращать только сериализуемые значения.
+"""
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable
+
+from bot.config import config
+from bot.logs import setup_worker_logging
+
+logger = logging.getLogger(__name__)
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=config.WORKER_PROCESSES, initializer=setup_worker_logging)
+        logger.info(f"Worker pool started: {config.WORKER_PROCESSES} processes")
+    return _executor
+
+
+async def run_in_worker(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), fn, *args)
+
+
+def shutdown_workers():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
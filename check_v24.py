@@ -13,7 +13,6 @@ from bot.search import get_tavily_search
 from bot.llm import llm_client
 from bot.storage import conversation_storage
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = Router()
@@ -77,7 +76,7 @@ async def handle_question(message: Message):
         try:
             if os.path.exists(law_path):
                 with open(law_path, "r", encoding="utf-8") as f:
-                    law_context = f.read()[:50000]
+                    law_context = f.read(50000)
         except Exception as e:
             logger.error(f"Error reading law file: {e}")
 
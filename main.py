@@ -1,38 +1,38 @@
 import asyncio
 import logging
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties # <-- Новый импорт
-from aiogram.enums import ParseMode
+from aiogram import Dispatcher
 
-from bot.config import config
+from bot.bots import BotContextMiddleware, create_bots, load_profiles
 from bot.handlers import router
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+from bot.lifecycle import shutdown, startup
+from bot.logs import setup_logging
 
 
 async def main():
-    if not config.TELEGRAM_BOT_TOKEN:
+    profiles = load_profiles()
+    if not profiles:
         print("❌ Ошибка: TELEGRAM_BOT_TOKEN не задан. Проверь .env")
         return
 
-    # <-- Вот здесь изменение: используем default=DefaultBotProperties(...)
-    bot = Bot(
-        token=config.TELEGRAM_BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    
+    # Боты из BOTS_FILE (или один бот) с общей HTTP-сессией; parse_mode=HTML у всех
+    bots = create_bots(profiles)
+
     dp = Dispatcher()
+    dp.update.outer_middleware(BotContextMiddleware(bots))
     dp.include_router(router)
 
     logging.info("🚀 Бот запускается...")
+    await startup()
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    for bot, _ in bots:
+        await bot.delete_webhook(drop_pending_updates=True)
+    try:
+        await dp.start_polling(*(bot for bot, _ in bots))
+    finally:
+        await shutdown()
 
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(main())
@@ -1,50 +1,88 @@
 import asyncio
+import hmac
 import logging
 import os
+import signal
 from aiohttp import web
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
+from aiogram import Dispatcher
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
+from bot.accounting import accountant
+from bot.bots import BotContextMiddleware, create_bots, load_profiles, webhook_path
 from bot.config import config
 from bot.handlers import router
-
-logging.basicConfig(level=logging.INFO)
+from bot.lifecycle import shutdown, startup
+from bot.logs import setup_logging
+from bot.profiling import profiler
 
 async def on_startup(app):
+    await startup()
     logging.info("Webhook запущен!")
 
 async def on_shutdown(app):
+    await shutdown()
     logging.warning("Webhook остановлен.")
 
+def _check_debug_token(request: web.Request):
+    token = request.headers.get("X-Profile-Token") or request.query.get("token", "")
+    if not config.PROFILE_TOKEN or not hmac.compare_digest(token, config.PROFILE_TOKEN):
+        raise web.HTTPNotFound()
+
+async def debug_usage(request: web.Request) -> web.Response:
+    """/debug/usage?token=...[&day=YYYY-MM-DD] — запросы, токены и поиск за день по ботам."""
+    _check_debug_token(request)
+    return web.json_response(await accountant.report(request.query.get("day")))
+
+async def debug_profile(request: web.Request) -> web.Response:
+    """
+    /debug/profile?token=... — список снимков;
+    &next=N — профилировать следующие N запросов;
+    &seconds=S — снять профиль всего event loop за S секунд (до 60).
+    """
+    _check_debug_token(request)
+    try:
+        if "seconds" in request.query:
+            seconds = min(max(float(request.query["seconds"]), 0.1), 60.0)
+            files = await profiler.capture_window(seconds)
+            if not files:
+                return web.json_response({"error": "another capture is running"}, status=409)
+            return web.json_response({"captured": files})
+        if "next" in request.query:
+            count = min(max(int(request.query["next"]), 1), 100)
+            profiler.request_captures(count)
+            return web.json_response({"scheduled": count})
+    except ValueError:
+        raise web.HTTPBadRequest(text="next/seconds must be numbers")
+    return web.json_response({"captures": profiler.list_captures()})
+
 async def main():
-    bot = Bot(
-        token=config.TELEGRAM_BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    
+    profiles = load_profiles()
+    if not profiles:
+        logging.error("❌ Ни одного бота: задайте TELEGRAM_BOT_TOKEN или BOTS_FILE")
+        return
+    # Все боты — через один диспетчер, одну HTTP-сессию и общие индексы и кэши
+    bots = create_bots(profiles)
+
     dp = Dispatcher()
+    dp.update.outer_middleware(BotContextMiddleware(bots))
     dp.include_router(router)
     
     # Создаём веб-приложение
     app = web.Application()
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
+    app.router.add_get("/debug/profile", debug_profile)
+    app.router.add_get("/debug/usage", debug_usage)
     
-    # Настраиваем обработчик webhook
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-    )
-    
-    # !!! ИСПРАВЛЕНИЕ ЗДЕСЬ !!!
-    # Регистрируем обработчик на конкретный путь
-    webhook_requests_handler.register(app, path="/webhook")
+    # Настраиваем обработчики webhook: у каждого бота свой путь /webhook/<имя>
+    for bot, profile in bots:
+        path = webhook_path(profile)
+        SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=path)
+        logging.info(f"Bot '{profile.name}' webhook: {path}")
     
     # Настраиваем приложение (связываем app и dispatcher)
-    setup_application(app, dp, bot=bot)
+    setup_application(app, dp, bots=[bot for bot, _ in bots])
 
     # Запускаем сервер
     runner = web.AppRunner(app)
@@ -56,10 +94,19 @@ async def main():
     
     logging.info(f"Webhook сервер запущен на порту {port}")
     
-    # Держим сервер запущенным бесконечно
-    await asyncio.Event().wait()
+    # Работаем до SIGTERM (остановка контейнера) или SIGINT; cleanup вызывает
+    # on_shutdown — учет дописывает буфер usage, клиенты закрываются
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):